@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks for kbd-layout.py.
+
+Times the startup of the command line tool, keymap parsing (bundled keymaps, synthetic large keymaps, deep include
+chains and dumpkeys-sized inputs) against the reference parser of the first
+kbd-layout.py, keysym label resolution, keymap diffs,
+reverse typing indexes, corpus heatmaps and layout rendering. Results are written as JSON and can be saved as a
+baseline and compared against it to catch slowdowns. Comparisons are made
+relative to the reference parser, timed in the same run, and suspected
+slowdowns are measured again before they fail. A benchmark with a reference
+run is timed in turns with it and fails when it is not faster than the
+reference. Startup times are also held to a fixed budget of 70 ms by
+default, as the tool is run many times from scripts.
+"""
+import glob
+import importlib.util
+import io
+import json
+import os
+import py_compile
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_kbd_layout():
+    spec = importlib.util.spec_from_file_location('kbd_layout', os.path.join(HERE, 'kbd_layout.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_reference_parser():
+    spec = importlib.util.spec_from_file_location('reference_parser', os.path.join(HERE, 'tests', 'reference_parser.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+KEYSYM_POOL = [
+    'a', 'b', 'q', 'z', 'A', 'Q', 'one', 'exclam', 'at', 'numbersign', 'Escape', 'Tab', 'Return',
+    'BackSpace', 'Delete', 'space', 'Control_a', 'Control_z', 'Meta_a', 'Meta_Control_z', 'Meta_Tab',
+    'F1', 'F12', 'Console_13', 'KP_7', 'KP_Add', 'Shift', 'AltGr', 'Control', 'Alt', 'Caps_Lock',
+    'dead_acute', 'dead_caron', 'ccaron', 'Scaron', 'eacute', 'sterling', 'currency', 'VoidSymbol',
+    'U+0142', 'U+20ac', '+a', '+Z', 'cyrillic_small_letter_ghe', 'Home', 'PageUp', 'nobreakspace',
+]
+
+DUMPKEYS_MODIFIERS = ['shift', 'altgr', 'control', 'alt']
+
+
+def write_big_keymap(path, *, keycodes, columns):
+    rng = random.Random(1)
+    with open(path, 'w', encoding='latin1') as f:
+        f.write(f'keymaps 0-{columns - 1}\n')
+        for code in range(1, keycodes + 1):
+            keysyms = ' '.join(rng.choice(KEYSYM_POOL) for _ in range(columns))
+            f.write(f'keycode {code} = {keysyms}\n')
+
+
+def write_include_chain(directory, *, depth, keycodes):
+    rng = random.Random(2)
+    for i in range(depth):
+        with open(os.path.join(directory, f'chain-{i}.inc'), 'w', encoding='latin1') as f:
+            if i + 1 < depth:
+                f.write(f'include "chain-{i + 1}"\n')
+            for code in rng.sample(range(1, 128), keycodes):
+                f.write(f'keycode {code} = {rng.choice(KEYSYM_POOL)} {rng.choice(KEYSYM_POOL)}\n')
+                f.write(f'alt keycode {code} = {rng.choice(KEYSYM_POOL)}\n')
+    path = os.path.join(directory, 'deep.map')
+    with open(path, 'w', encoding='latin1') as f:
+        f.write('include "chain-0"\n')
+    return path
+
+
+def write_dumpkeys_keymap(path, *, keycodes, columns):
+    """Write a keymap in the one-binding-per-line form produced by `dumpkeys -f`."""
+    rng = random.Random(3)
+    with open(path, 'w', encoding='latin1') as f:
+        f.write(f'keymaps 0-{columns - 1}\n')
+        for code in range(1, keycodes + 1):
+            f.write(f'keycode {code:3d} = {rng.choice(KEYSYM_POOL)}\n')
+            for column in range(1, columns):
+                modifiers = ' '.join(name for bit, name in enumerate(DUMPKEYS_MODIFIERS) if column & (1 << bit))
+                f.write(f'\t{modifiers}\tkeycode {code:3d} = {rng.choice(KEYSYM_POOL)}\n')
+        for i in range(1, 257):
+            f.write(f'string F{i} = "\\033[{i}~"\n')
+        for i in range(512):
+            first = chr(0x21 + i % 90).replace('\\', '\\\\')
+            f.write(f"compose '{first}' '{chr(0x21 + i // 90)}' to '{chr(0xc0 + i % 64)}'\n")
+
+
+def benchmarks(kbd, workdir):
+    bundled = sorted(glob.glob(os.path.join(HERE, 'keymaps', '*.map')))
+    include_path = [os.path.join(HERE, 'keymaps')]
+
+    big = os.path.join(workdir, 'big.map')
+    write_big_keymap(big, keycodes=400, columns=256)
+    deep = write_include_chain(workdir, depth=32, keycodes=24)
+    dumpkeys = os.path.join(workdir, 'dumpkeys.map')
+    write_dumpkeys_keymap(dumpkeys, keycodes=128, columns=16)
+    reference = load_reference_parser()
+
+    def parse(filenames):
+        def run():
+            kbd.clear_caches()
+            for filename in filenames:
+                kbd.load_keymap(filename, include_path=include_path)
+        return run
+
+    def reference_parse(filenames):
+        def run():
+            for filename in filenames:
+                reference.load_keymap(filename, include_path[0])
+        return run
+
+    def parse_disk_cached(filenames):
+        cache_dir = os.path.join(workdir, 'cache')
+
+        def run():
+            kbd.clear_caches()
+            for filename in filenames:
+                kbd.load_keymap(filename, include_path=include_path, cache_dir=cache_dir)
+        return run
+
+    def parse_warm(filenames):
+        def run():
+            for filename in filenames:
+                kbd.load_keymap(filename, include_path=include_path)
+        return run
+
+    keysyms = set(KEYSYM_POOL)
+    for filename in bundled:
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+        for code in keymap:
+            keysyms.update(keymap.keysyms(code))
+    keysyms = sorted(keysyms)
+    for keysym in list(keysyms):
+        try:
+            kbd.keysym_label(keysym)
+        except ValueError:
+            keysyms.remove(keysym)
+
+    def labels():
+        for keysym in keysyms:
+            kbd.keysym_label(keysym)
+
+    def resolve(filename):
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+
+        def run():
+            kbd.resolve_keysym.cache_clear()
+            kbd.resolve_labels(keymap)
+        return run
+
+    def render(layout, filename):
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+
+        def run():
+            layout.render(kbd.RenderContext(0, 0, scale=60, keymap=keymap, out=io.StringIO()))
+        return run
+
+    def write_svg(layout_name, filename, **options):
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+
+        def run():
+            kbd.write_svg(io.StringIO(), kbd.LAYOUTS[layout_name], keymap, scale=60, **options)
+        return run
+
+    def diff(old_filename, new_filename, *, svg=False):
+        old = kbd.load_keymap(old_filename, include_path=include_path)
+        new = kbd.load_keymap(new_filename, include_path=include_path)
+
+        def run():
+            if svg:
+                kbd.write_diff_svg(io.StringIO(), kbd.ANSI_LAYOUT, old, new, scale=60)
+            else:
+                kbd.keymap_diff(old, new)
+        return run
+
+    def typing_index(filename):
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+
+        def run():
+            keymap._typing_index = None
+            keymap.typing_index()
+        return run
+
+    def heatmap(filename):
+        keymap = kbd.load_keymap(filename, include_path=include_path)
+        with open(os.path.join(HERE, 'kbd_layout.py'), encoding='utf-8') as f:
+            corpus = f.read() * 8
+
+        def run():
+            chunks = (corpus[i:i + kbd.HEATMAP_CHUNK_SIZE] for i in range(0, len(corpus), kbd.HEATMAP_CHUNK_SIZE))
+            kbd.key_usage(keymap, chunks)
+        return run
+
+    def startup(*args):
+        # Runs use the cached bytecode of kbd_layout.py, as they would once
+        # it has been imported, even when bytecode writing is disabled.
+        py_compile.compile(os.path.join(HERE, 'kbd_layout.py'), doraise=True)
+        command = [sys.executable, os.path.join(HERE, 'kbd-layout.py'), *args]
+
+        def run():
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        return run
+
+    uk = os.path.join(HERE, 'keymaps', 'uk.map')
+    return [
+        ('startup/help', startup('--help')),
+        ('startup/how-to-type-uk', startup('--how-to-type', 'a', uk)),
+        # The large keymaps have no reference run: the reference keeps the
+        # split keysyms of every line, and interning 256 keysyms a line into
+        # the keymap's arrays takes longer than the reference's whole loop.
+        # They are only compared with their baseline.
+        ('reference/load_keymap/bundled', reference_parse(bundled)),
+        ('load_keymap/bundled', parse(bundled)),
+        ('load_keymap/bundled-warm', parse_warm(bundled)),
+        ('load_keymap/bundled-disk-cache', parse_disk_cached(bundled)),
+        ('load_keymap/big-256-columns', parse([big])),
+        ('load_keymap/big-256-columns-disk-cache', parse_disk_cached([big])),
+        ('load_keymap/include-chain-32', parse([deep])),
+        ('load_keymap/dumpkeys', parse([dumpkeys])),
+        ('keysym_label/bundled-keysyms', labels),
+        ('resolve_labels/big-256-columns', resolve(big)),
+        ('render/ansi-uk', render(kbd.ANSI_LAYOUT, uk)),
+        ('render/iso-uk', render(kbd.ISO_LAYOUT, uk)),
+        ('render/ansi-big', render(kbd.ANSI_LAYOUT, big)),
+        ('write_svg/iso-uk', write_svg('iso', uk)),
+        ('write_svg/iso-uk-compact', write_svg('iso', uk, compact=True)),
+        ('keymap_diff/defkeymap-uk', diff(os.path.join(HERE, 'keymaps', 'defkeymap.map'), uk)),
+        ('keymap_diff/big-256-columns', diff(big, dumpkeys)),
+        ('typing_index/cz', typing_index(os.path.join(HERE, 'keymaps', 'cz.map'))),
+        ('typing_index/big-256-columns', typing_index(big)),
+        ('key_usage/uk-source-corpus', heatmap(uk)),
+        ('write_diff_svg/defkeymap-uk', diff(os.path.join(HERE, 'keymaps', 'defkeymap.map'), uk, svg=True)),
+    ]
+
+
+def measure(func, *, repeat, min_time):
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best, number
+
+
+def reference_ratio(func, reference, *, number, pairs):
+    """Return the median ratio of the time of number runs of func to that of number runs of reference, timed in turns.
+
+    Timing them one right after the other keeps a burst of load on the
+    machine from slowing down only one of them.
+    """
+    ratios = []
+    for _ in range(pairs):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        middle = time.perf_counter()
+        for _ in range(number):
+            reference()
+        ratios.append((middle - start) / (time.perf_counter() - middle))
+    return statistics.median(ratios)
+
+
+# The benchmark that other times are compared relative to, so that a baseline
+# saved while the machine was faster or slower still applies.
+REFERENCE = 'reference/load_keymap/bundled'
+
+
+def compare(results, baseline, threshold, noise_floor):
+    """Return the names of the results slower than their baseline by more than threshold times and noise_floor seconds.
+
+    Baseline times are first scaled by how the REFERENCE benchmark of the
+    same run compares with its own baseline.
+    """
+    scale = 1.0
+    if REFERENCE in results and REFERENCE in baseline:
+        scale = results[REFERENCE]['seconds'] / baseline[REFERENCE]['seconds']
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or name == REFERENCE:
+            continue
+        expected = baseline[name]['seconds'] * scale
+        ratio = result['seconds'] / expected
+        result['baseline_ratio'] = round(ratio, 3)
+        if ratio > threshold and result['seconds'] - expected > noise_floor:
+            regressions.append(name)
+    return regressions
+
+
+def behind_reference(results):
+    """Return the names of the results that take at least as long as their reference/ benchmark."""
+    return [name for name, result in results.items() if result.get('reference_ratio', 0) >= 1]
+
+
+def over_budget(results, budget):
+    return [name for name, result in results.items() if name.startswith('startup/') and result['seconds'] > budget]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark kbd-layout.py.')
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this string.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of timed repeats per benchmark (the best one is reported).')
+    parser.add_argument('--min-time', type=float, default=0.1, help='The minimal duration of a timed repeat in seconds.')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as a baseline, unless they fail.')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with a saved baseline and fail on regressions.')
+    parser.add_argument('--startup-budget', type=float, default=0.07, help='The time in seconds that a startup benchmark may take before it fails (default: 0.07).')
+    parser.add_argument('--threshold', type=float, default=1.5, help='The slowdown ratio against the baseline, relative to the reference benchmark, that counts as a regression.')
+    parser.add_argument('--noise-floor', type=float, default=0.0005, help='The time in seconds that a benchmark must lose against the baseline to count as a regression.')
+    parser.add_argument('--pairs', type=int, default=15, help='The number of turns in which a benchmark and its reference are timed to compare them.')
+    parser.add_argument('--retries', type=int, default=3, help='How many times suspected regressions are measured again before they fail.')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    kbd = load_kbd_layout()
+    results = {}
+    slower = []
+    with tempfile.TemporaryDirectory() as workdir:
+        funcs = dict(benchmarks(kbd, workdir))
+        for name, func in funcs.items():
+            # Comparisons are relative to the reference, so it always runs.
+            if args.filter not in name and not (baseline is not None and name == REFERENCE):
+                continue
+            seconds, number = measure(func, repeat=args.repeat, min_time=args.min_time)
+            results[name] = {'seconds': seconds, 'loops': number}
+            print(f'{name}: {seconds*1000:.3f} ms', file=sys.stderr)
+
+        def measure_reference_ratios(names):
+            # A ratio measured again only replaces a higher one.
+            for name in names:
+                ratio = reference_ratio(funcs[name], funcs['reference/' + name], number=results[name]['loops'], pairs=args.pairs)
+                results[name]['reference_ratio'] = round(min(ratio, results[name].get('reference_ratio', ratio)), 3)
+
+        measure_reference_ratios([name for name in results if 'reference/' + name in results])
+        if baseline is not None:
+            slower = compare(results, baseline, args.threshold, args.noise_floor)
+        behind = behind_reference(results)
+        for _ in range(args.retries):
+            if not slower and not behind:
+                break
+            # A burst of load on the machine can slow down a few
+            # benchmarks: measure them again, each right after the
+            # reference that scales it, and keep the best ratios.
+            still_slower = []
+            for name in slower:
+                turn = {}
+                for timed in [REFERENCE, name]:
+                    seconds, number = measure(funcs[timed], repeat=args.repeat, min_time=args.min_time)
+                    turn[timed] = {'seconds': seconds, 'loops': number}
+                if compare(turn, baseline, args.threshold, args.noise_floor):
+                    still_slower.append(name)
+                if turn[name]['baseline_ratio'] < results[name]['baseline_ratio']:
+                    results[name].update(turn[name])
+            slower = still_slower
+            measure_reference_ratios(behind)
+            behind = behind_reference(results)
+
+    for name, result in results.items():
+        if 'reference_ratio' in result:
+            print(f'{name}: {result["reference_ratio"]}x the time of the reference parser', file=sys.stderr)
+
+    regressions = over_budget(results, args.startup_budget)
+    for name in regressions:
+        print(f'over budget: {name} takes {results[name]["seconds"]*1000:.1f} ms, the budget is {args.startup_budget*1000:.1f} ms', file=sys.stderr)
+    regressions += behind
+    for name in behind:
+        print(f'slower than the reference: {name} takes {results[name]["reference_ratio"]}x the time of the reference parser', file=sys.stderr)
+    regressions += slower
+    for name in slower:
+        print(f'regression: {name} is {results[name]["baseline_ratio"]}x slower than the baseline', file=sys.stderr)
+
+    report = {
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'results': results,
+    }
+    if args.save and regressions:
+        # A baseline over budget or behind the reference would let later runs pass.
+        print(f'not saving {args.save}: the results fail', file=sys.stderr)
+    elif args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
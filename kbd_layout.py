@@ -0,0 +1,3705 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+_START = time.perf_counter()
+
+import os
+import sys
+from array import array
+from collections import Counter, namedtuple
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from itertools import accumulate, chain, compress
+from operator import itemgetter
+
+# from https://github.com/legionus/kbd/blob/master/src/libkeymap/syms.synonyms.h
+keysym_synonyms = {
+    "Control_h": "BackSpace",
+    "Control_i": "Tab",
+    "Control_j": "Linefeed",
+    "Home": "Find",
+    "End": "Select",
+    "PageUp": "Prior",
+    "PageDown": "Next",
+    "multiplication": "multiply",
+    "pound": "sterling",
+    "pilcrow": "paragraph",
+    "Oslash": "Ooblique",
+    "Shift_L": "ShiftL",
+    "Shift_R": "ShiftR",
+    "Control_L": "CtrlL",
+    "Control_R": "CtrlR",
+    "AltL": "Alt",
+    "AltR": "AltGr",
+    "Alt_L": "Alt",
+    "Alt_R": "AltGr",
+    "AltGr_L": "Alt",
+    "AltGr_R": "AltGr",
+    "AltLLock": "Alt_Lock",
+    "AltRLock": "AltGr_Lock",
+    "SCtrl": "SControl",
+    "Spawn_Console": "KeyboardSignal",
+    "Uncaps_Shift": "CapsShift",
+    "lambda": "lamda",
+    "Lambda": "Lamda",
+    "xi": "ksi",
+    "Xi": "Ksi",
+    "chi": "khi",
+    "Chi": "Khi",
+    "tilde": "asciitilde",
+    "circumflex": "asciicircum",
+    "dead_ogonek": "dead_cedilla",
+    "dead_caron": "dead_circumflex",
+    "dead_breve": "dead_tilde",
+    "dead_doubleacute": "dead_tilde",
+    "Idotabove": "Iabovedot",
+    "dotlessi": "idotless",
+    "no-break_space": "nobreakspace",
+    "paragraph_sign": "section",
+    "soft_hyphen": "hyphen",
+    "bielorussian_cyrillic_capital_letter_i": "ukrainian_cyrillic_capital_letter_i",
+    "cyrillic_capital_letter_kha": "cyrillic_capital_letter_ha",
+    "cyrillic_capital_letter_ge": "cyrillic_capital_letter_ghe",
+    "cyrillic_capital_letter_ia": "cyrillic_capital_letter_ya",
+    "cyrillic_capital_letter_iu": "cyrillic_capital_letter_yu",
+    "cyrillic_capital_letter_yeri": "cyrillic_capital_letter_yeru",
+    "cyrillic_capital_letter_reversed_e": "cyrillic_capital_letter_e",
+    "cyrillic_capital_letter_ii": "cyrillic_capital_letter_i",
+    "cyrillic_capital_letter_short_ii": "cyrillic_capital_letter_short_i",
+    "bielorussian_cyrillic_small_letter_i": "ukrainian_cyrillic_small_letter_i",
+    "cyrillic_small_letter_kha": "cyrillic_small_letter_ha",
+    "cyrillic_small_letter_ge": "cyrillic_small_letter_ghe",
+    "cyrillic_small_letter_ia": "cyrillic_small_letter_ya",
+    "cyrillic_small_letter_iu": "cyrillic_small_letter_yu",
+    "cyrillic_small_letter_yeri": "cyrillic_small_letter_yeru",
+    "cyrillic_small_letter_reversed_e": "cyrillic_small_letter_e",
+    "cyrillic_small_letter_ii": "cyrillic_small_letter_i",
+    "cyrillic_small_letter_short_ii": "cyrillic_small_letter_short_i",
+    "ukrainian_cyrillic_small_letter_ghe_with_upturn": "cyrillic_small_letter_ghe_with_upturn",
+    "ukrainian_cyrillic_capital_letter_ghe_with_upturn": "cyrillic_capital_letter_ghe_with_upturn",
+    "rightanglequote": "guillemotright",
+}
+
+KT_LATIN = {
+    'nul': '␀',
+    'Control_a': 'C-a',
+    'Control_b': 'C-b',
+    'Control_c': 'C-c',
+    'Control_d': 'C-d',
+    'Control_e': 'C-e',
+    'Control_f': 'C-f',
+    'Control_g': 'C-g',
+    'BackSpace': 'BS',  # C-h
+    'Tab': 'TAB',  # C-i
+    'Linefeed': 'LF',  # C-j
+    'Control_k': 'C-k',
+    'Control_l': 'C-l',
+    'Control_m': 'C-m',
+    'Control_n': 'C-n',
+    'Control_o': 'C-o',
+    'Control_p': 'C-p',
+    'Control_q': 'C-q',
+    'Control_r': 'C-r',
+    'Control_s': 'C-s',
+    'Control_t': 'C-t',
+    'Control_u': 'C-u',
+    'Control_v': 'C-v',
+    'Control_w': 'C-w',
+    'Control_x': 'C-x',
+    'Control_y': 'C-y',
+    'Control_z': 'C-z',
+    'Escape': 'ESC',
+    'Control_backslash': 'C-\\',
+    'Control_bracketright': 'C-]',
+    'Control_asciicircum': 'C-^',
+    'Control_underscore': 'C-_',
+    'space': 'SPACE',
+    'exclam': '!',
+    'quotedbl': '"',
+    'numbersign': '#',
+    'dollar': '$',
+    'percent': '%',
+    'ampersand': '&',
+    'apostrophe': "'",
+    'parenleft': '(',
+    'parenright': ')',
+    'asterisk': '*',
+    'plus': '+',
+    'comma': ',',
+    'minus': '-',
+    'period': '.',
+    'slash': '/',
+    'zero': '0',
+    'one': '1',
+    'two': '2',
+    'three': '3',
+    'four': '4',
+    'five': '5',
+    'six': '6',
+    'seven': '7',
+    'eight': '8',
+    'nine': '9',
+    'colon': ':',
+    'semicolon': ';',
+    'less': '<',
+    'equal': '=',
+    'greater': '>',
+    'question': '?',
+    'at': '@',
+    # A..Z
+    'bracketleft': '[',
+    'backslash': '\\',
+    'bracketright': ']',
+    'asciicircum': '^',
+    'underscore': '_',
+    'grave': '`',
+    # a..z
+    'braceleft': '{',
+    'bar': '|',
+    'braceright': '}',
+    'asciitilde': '~',
+    'Delete': '⌫',
+}
+for i in range(26):
+    KT_LATIN[chr(ord('a') + i)] = chr(ord("a") + i)
+    KT_LATIN[chr(ord('A') + i)] = chr(ord("A") + i)
+
+
+@lru_cache(maxsize=None)
+def labels_table():
+    """Return LABELS, the labels of keysyms by name, built on first use."""
+    labels = {
+        **KT_LATIN,
+        'Aacute': 'Á',
+        'Ccaron': 'Č',
+        'Dstroke': 'Đ',
+        'Eacute': 'É',
+        'Ecaron': 'Ě',
+        'Iacute': 'Í',
+        'Lstroke': 'Ł',
+        'Rcaron': 'Ř',
+        'Scaron': 'Š',
+        'Uacute': 'Ú',
+        'Uring': 'Ů',
+        'Yacute': 'Ý',
+        'Zcaron': 'Ž',
+        'aacute': 'á',
+        'ccaron': 'č',
+        'dstroke': 'đ',
+        'eacute': 'é',
+        'ecaron': 'ě',
+        'lstroke': 'ł',
+        'rcaron': 'ř',
+        'scaron': 'š',
+        'ssharp': 'ß',
+        'uacute': 'ú',
+        'uring': 'ů',
+        'yacute': 'ý',
+        'zcaron': 'ž',
+
+        'Alt': 'ALT',
+        'AltGr': 'ALTGR',
+        'AltGr_Lock': 'ALTGR LOCK',
+        'Bare_Num_Lock': 'BARE NUM LOCK',
+        'Break': 'BREAK',
+        'Caps_Lock': 'CAPS LOCK',
+        'Compose': 'COM- POSE',
+        'Control': 'CTRL',
+        'Decr_Console': 'DEC CON',
+        'Down': '↓',
+        'Escape': 'ESC',
+        'Find': 'HOME',
+        'Incr_Console': 'INC CON',
+        'Insert': 'INS',
+        'KP_Add': '+ (KP)',
+        'KP_Divide': '/ (KP)',
+        'KP_Enter': 'Enter (KP)',
+        'KP_Multiply': '* (KP)',
+        'KP_Period': '. (KP)',
+        'KP_Subtract': '- (KP)',
+        'Last_Console': 'LAST CON',
+        'Left': '←',
+        'Next': 'PGDN',
+        'Num_Lock': 'NUM LOCK',
+        'Pause': 'PAUSE',
+        'Prior': 'PGUP',
+        'Remove': 'DEL',
+        'Return': '↵',
+        'Right': '→',
+        'Scroll_Backward': 'SCROLL BACK',
+        'Scroll_Forward': 'SCROLL FWD',
+        'Scroll_Lock': 'SCROLL LOCK',
+        'Select': 'END',
+        'Shift': 'SHIFT',
+        'ShiftL': 'SHIFTL',
+        'ShiftL_Lock': 'SHIFTL LOCK',
+        'ShiftR': 'SHIFTR',
+        'ShiftR_Lock': 'SHIFTR LOCK',
+        'Show_Memory': 'SHOW MEM',
+        'Show_Registers': 'SHOW REGS',
+        'Show_State': 'SHOW STATE',
+        'Tab': 'TAB',
+        'Up': '↑',
+        'VoidSymbol': '',
+        'currency': '¤',
+        'dead_acute': '◌́',
+        'dead_caron': '◌̌',
+        'dead_cedilla': '◌̧',
+        'dead_circumflex': '◌̂',
+        'dead_diaeresis': '◌̈',
+        'dead_grave': '◌̀',
+        'dead_tilde': '◌̃',
+        'degree': '°',
+        'division': '÷',
+        'iacute': 'í',
+        'multiply': '×',
+        'section': '§',
+        'sterling': '£',
+    }
+    for i in range(10):
+        labels[f'KP_{i}'] = f'{i} (KP)'
+    for i in range(64):
+        labels[f'Console_{i}'] = f'CON{i}'
+    for keysym, label in KT_LATIN.items():
+        labels[f'Meta_{keysym}'] = f'M-{label}'
+    return labels
+
+
+KeysymLabel = namedtuple('KeysymLabel', 'label status error')
+
+KEYSYM_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=KEYSYM_CACHE_SIZE)
+def resolve_keysym(keysym):
+    """Resolve the label of a keysym.
+
+    status is 'ok' for known keysyms, 'unknown' when the keysym's own name is
+    used as its label and 'error' when the keysym is invalid; error then holds
+    the message and the keysym's name is used as its label.
+    """
+    prefix = ""
+    if keysym.startswith('+'):
+        prefix = '+'
+        keysym = keysym[1:]
+    if keysym.startswith('U+'):
+        try:
+            return KeysymLabel(prefix + chr(int(keysym[2:], 16)), 'ok', None)
+        except ValueError:
+            return KeysymLabel(prefix + keysym, 'error', f'Invalid Unicode keysym: {keysym}')
+    if keysym in keysym_synonyms:
+        keysym = keysym_synonyms[keysym]
+    if keysym.startswith('Meta_'):
+        non_meta_keysym = keysym[len('Meta_'):]
+        if non_meta_keysym in keysym_synonyms:
+            non_meta_keysym = keysym_synonyms[non_meta_keysym]
+        if non_meta_keysym in KT_LATIN:
+            return KeysymLabel(prefix + 'M-' + KT_LATIN[non_meta_keysym], 'ok', None)
+        return KeysymLabel(prefix + keysym, 'error', f'Unknown keysym: {keysym}')
+    labels = labels_table()
+    if keysym in labels:
+        return KeysymLabel(prefix + labels[keysym], 'ok', None)
+    return KeysymLabel(prefix + keysym, 'unknown', None)
+
+
+def keysym_label(keysym):
+    label, status, error = resolve_keysym(keysym)
+    if status == 'error':
+        raise ValueError(error)
+    return label
+
+
+def keysym_known(keysym):
+    """Whether keysym_label() has a label for keysym instead of falling back to its name."""
+    return resolve_keysym(keysym).status == 'ok'
+
+
+# The characters typed by keysyms whose labels are not the character itself.
+KEYSYM_CHARACTERS = {
+    'space': ' ',
+    'nobreakspace': '\u00a0',
+    'Return': '\n',
+    'Tab': '\t',
+    'Delete': None,
+    'Down': None,
+    'Left': None,
+    'Right': None,
+    'Up': None,
+}
+
+
+@lru_cache(maxsize=KEYSYM_CACHE_SIZE)
+def keysym_character(keysym):
+    """Return the character typed by a keysym, or None for keysyms that type no character."""
+    if keysym.startswith('+'):
+        keysym = keysym[1:]
+    name = keysym_synonyms.get(keysym, keysym)
+    if name in KEYSYM_CHARACTERS:
+        return KEYSYM_CHARACTERS[name]
+    if keysym.startswith('Meta_'):
+        return None
+    label, status, error = resolve_keysym(keysym)
+    return label if status == 'ok' and len(label) == 1 else None
+
+
+class LabelMatrix:
+    """The labels of every column of a set of keycodes.
+
+    unknown holds the keysyms that are labelled with their own names and
+    errors maps invalid keysyms to their error messages.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.unknown = set()
+        self.errors = {}
+
+
+def resolve_labels(keymap, codes=None):
+    """Resolve the labels of a keymap, or of some of its keycodes, in one pass.
+
+    Every distinct keysym is resolved once, and invalid keysyms are recorded in
+    the result instead of raising.
+    """
+    matrix = LabelMatrix()
+    labels = {}
+    for code in (keymap if codes is None else codes):
+        row = []
+        for keysym in keymap.get(code, []):
+            label = labels.get(keysym)
+            if label is None:
+                label, status, error = resolve_keysym(keysym)
+                labels[keysym] = label
+                if status == 'unknown':
+                    matrix.unknown.add(keysym)
+                elif status == 'error':
+                    matrix.errors[keysym] = error
+            row.append(label)
+        matrix.labels[code] = row
+    return matrix
+
+
+def main_label(labels):
+    if not labels:
+        return ""
+    label = labels[0]
+    if len(label) > 1 and label[0] == '+':
+        return label[1:]
+    return label
+
+
+def key_classes(main_label):
+    if main_label == 'CAPS LOCK':
+        return 'key mod'
+    if main_label.endswith(' LOCK'):
+        main_label = main_label[:len(' LOCK')]
+    if main_label in ('SHIFT', 'ALTGR', 'CTRL', 'ALT', 'SHIFTL', 'SHIFTR', 'CTRLR', 'CTRLL', 'CAPSSHIFT'):
+        return 'key mod'
+    return 'key'
+
+
+class RenderContext:
+    def __init__(self, x, y, *, scale, keymap=None, out=None, label_table=None):
+        self.x = x
+        self.y = y
+        self.scale = scale
+        self.m = 1
+        self.keymap = keymap
+        self.out = out
+        self.label_table = label_table
+
+    def shift(self, dx, dy):
+        return RenderContext(self.x+dx, self.y+dy, scale=self.scale, keymap=self.keymap, out=self.out, label_table=self.label_table)
+
+    def keysyms(self, keycode):
+        return self.keymap.get(keycode, [])
+
+
+def xml_escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def svg_label(text_x, label):
+    if ' ' in label:
+        words = label.split(' ')
+        return f'<tspan x="{text_x}" dy="0">{xml_escape(words[0])}</tspan>' + ''.join(f'<tspan x="{text_x}" dy="1em">{xml_escape(word)}</tspan>' for word in words[1:])
+    return xml_escape(label)
+
+
+class LabelTable:
+    """The distinct labels of a rendered keymap and how they change between columns.
+
+    Every key added to the table gets the index of its column 0 label in base.
+    For every column, diffs lists the keys whose label differs from that, so
+    switching columns in the browser only touches those keys. Keys are
+    numbered in the order they are added, as the script finds them in the
+    document. With a list of declared columns, only those columns are kept.
+    """
+
+    def __init__(self, columns=None):
+        self.columns = list(columns) if columns is not None else None
+        self.labels = ['']
+        self._index = {'': 0}
+        self._keys = []
+
+    def index(self, label):
+        i = self._index.get(label)
+        if i is None:
+            i = self._index[label] = len(self.labels)
+            self.labels.append(label)
+        return i
+
+    def add(self, labels):
+        self._keys.append(None)
+        self.set(len(self._keys) - 1, labels)
+
+    def set(self, k, labels):
+        """Replace the labels of the k-th key; the indexes of the other keys' labels stay valid."""
+        self._keys[k] = [self.index(label) for label in labels]
+
+    def data(self):
+        columns = self.columns
+        if columns is None:
+            columns = range(max((len(indexes) for indexes in self._keys), default=0))
+        base = [indexes[0] if indexes else 0 for indexes in self._keys]
+        diffs = []
+        diff_index = {}
+        column_diffs = {}
+        for column in columns:
+            diff = []
+            for k, indexes in enumerate(self._keys):
+                i = indexes[column] if column < len(indexes) else 0
+                if i != base[k]:
+                    diff += [k, i]
+            diff = tuple(diff)
+            if diff not in diff_index:
+                diff_index[diff] = len(diffs)
+                diffs.append(diff)
+            column_diffs[column] = diff_index[diff]
+        return {
+            'labels': self.labels,
+            'base': base,
+            'diffs': diffs,
+            'columns': column_diffs,
+        }
+
+    def script(self):
+        import json
+
+        table = json.dumps(self.data(), ensure_ascii=False, separators=(',', ':'))
+        return 'const labelTable = ' + table.replace(']]>', ']]\\u003e') + ';'
+
+
+KeyGeometry = namedtuple('KeyGeometry', 'keycode shape x y width height points text_x text_y bg')
+
+
+# The character that every dead key combines with in compose sequences.
+DEAD_KEYS = {
+    'dead_grave': '`',
+    'dead_acute': "'",
+    'dead_circumflex': '^',
+    'dead_tilde': '~',
+    'dead_diaeresis': '"',
+    'dead_cedilla': ',',
+}
+
+
+def string_text(s):
+    """Return a function key string with its control characters in caret notation."""
+    return ''.join('^' + chr(ord(c) ^ 0x40) if ord(c) < 0x20 or c == '\x7f' else c for c in s)
+
+
+def keysym_tooltip(keymap, keysym):
+    """Return what a dead key composes or what a function key sends in a keymap, or None."""
+    name = keysym_synonyms.get(keysym, keysym)
+    accent = DEAD_KEYS.get(name)
+    if accent is not None:
+        completions = keymap.compose.completions(accent)
+        if not completions:
+            return None
+        return f'{name}: ' + ' '.join(f'{second}→{result}' for second, result in completions.items())
+    text = keymap.strings.get(keysym, keymap.strings.get(name))
+    return f'{keysym}: {string_text(text)}' if text is not None else None
+
+
+def key_tooltips(keymap, keys):
+    """Return the tooltip of every key from the keysyms of its declared columns, or None for keys without one."""
+    tooltips = {}
+    titles = []
+    for key in keys:
+        keysyms = keymap.get(key.keycode, [])
+        lines = []
+        for keysym in dict.fromkeys(keysyms[column] for column in keymap.columns if column < len(keysyms)):
+            if keysym not in tooltips:
+                tooltips[keysym] = keysym_tooltip(keymap, keysym)
+            if tooltips[keysym] is not None:
+                lines.append(tooltips[keysym])
+        titles.append('\n'.join(lines) or None)
+    return titles
+
+
+def key_fragment(key, labels, title=None):
+    """Return the SVG of a key showing its main label."""
+    label = main_label(labels)
+    title = f'<title>{xml_escape(title)}</title>' if title is not None else ''
+    return (
+        f'<g class="{key_classes(label)}">' + title +
+            key.bg +
+            f'<text class="lbl" x="{key.text_x}" y="{key.text_y}">{svg_label(key.text_x, label)}</text></g>'
+    )
+
+
+def render_key(ctx, key, labels, title=None):
+    if ctx.label_table is not None:
+        ctx.label_table.add(labels)
+    ctx.out.write(key_fragment(key, labels, title))
+
+
+class CompiledLayout:
+    """The geometry of a layout at a given position and scale.
+
+    keys holds one KeyGeometry per key in rendering order. It does not depend
+    on the keymap, so rendering a keymap is a single pass over it.
+    """
+
+    def __init__(self, layout, ctx):
+        keys = []
+        self.scale = ctx.scale
+        self.margin = ctx.m
+        self.width, self.height = layout.compile(ctx, keys)
+        self.keys = tuple(keys)
+        self.compact = False
+        self.defs = ''
+        self._compacted = None
+
+    def compacted(self):
+        """Return a copy of the layout for compact output, made once.
+
+        Coordinates are rounded to one decimal, and rectangular keys <use> a
+        shared <rect> of their size from defs.
+        """
+        if self._compacted is None:
+            import copy
+
+            compacted = copy.copy(self)
+            sizes = {}
+            keys = []
+            for key in self.keys:
+                if key.shape == 'rect':
+                    size = (compact_number(key.width - 2*self.margin), compact_number(key.height - 2*self.margin))
+                    ref = sizes.setdefault(size, f'r{len(sizes)}')
+                    # SVG 1.1 viewers only follow xlink:href.
+                    bg = f'<use class="bg" href="#{ref}" xlink:href="#{ref}" x="{compact_number(key.x + self.margin)}" y="{compact_number(key.y + self.margin)}"/>'
+                else:
+                    bg = '<polygon class="bg" points="{}"/>'.format(' '.join(f'{compact_number(x)},{compact_number(y)}' for x, y in key.points))
+                keys.append(key._replace(text_x=compact_number(key.text_x), text_y=compact_number(key.text_y), bg=bg))
+            compacted.keys = tuple(keys)
+            compacted.compact = True
+            compacted.defs = ''.join(f'<rect id="{ref}" width="{width}" height="{height}"/>' for (width, height), ref in sizes.items())
+            compacted._compacted = compacted
+            self._compacted = compacted
+        return self._compacted
+
+    def nbytes(self):
+        """Estimate the memory used by the compiled layout."""
+        return sys.getsizeof(self.keys) + sum(sys.getsizeof(key) + sys.getsizeof(key.bg) + sys.getsizeof(key.points) for key in self.keys)
+
+    def labels(self, ctx):
+        matrix = resolve_labels(ctx.keymap, [key.keycode for key in self.keys])
+        return [matrix.labels[key.keycode] for key in self.keys]
+
+    def render(self, ctx, labels=None, titles=None):
+        if labels is None:
+            labels = self.labels(ctx)
+        if titles is None:
+            titles = [None] * len(self.keys)
+        for key, key_labels, title in zip(self.keys, labels, titles):
+            render_key(ctx, key, key_labels, title)
+        return self.width, self.height
+
+
+_compiled_layouts = {}
+
+
+def compact_number(value):
+    """Format a coordinate for compact output, with at most one decimal."""
+    return format(round(value, 1), 'g')
+
+
+def compile_layout(layout, scale):
+    compiled = _compiled_layouts.get((layout, scale))
+    if compiled is None:
+        compiled = _compiled_layouts[layout, scale] = CompiledLayout(layout, RenderContext(0, 0, scale=scale))
+    return compiled
+
+
+class LayoutNode:
+    def render(self, ctx):
+        if ctx.x == 0 and ctx.y == 0:
+            compiled = compile_layout(self, ctx.scale)
+        else:
+            compiled = CompiledLayout(self, ctx)
+        return compiled.render(ctx)
+
+
+class Key(LayoutNode):
+    def __init__(self, keycode, *, width=1, height=1):
+        global keys
+        self._keycode = keycode
+        self._width = width
+        self._height = height
+
+    def __repr__(self):
+        args = [repr(self._keycode)]
+        if self._width != 1:
+            args.append(f'width={self._width}')
+        if self._height != 1:
+            args.append(f'height={self._height}')
+        return f'Key({", ".join(args)})'
+
+    def keys(self):
+        return 1
+
+    def compile(self, ctx, keys):
+        width = self._width*ctx.scale
+        height = self._height*ctx.scale
+        keys.append(KeyGeometry(
+            self._keycode, 'rect', ctx.x, ctx.y, width, height, None, ctx.x + width/2, ctx.y + height/2,
+            f'<rect class="bg" x="{ctx.x + ctx.m}" y="{ctx.y + ctx.m}" width="{width - 2*ctx.m}" height="{height - 2*ctx.m}"/>',
+        ))
+        return width, height
+
+
+class ISOEnterKey(LayoutNode):
+    def __init__(self, keycode, width1, width2, height1, height2):
+        self._keycode = keycode
+        self._width1 = width1
+        self._width2 = width2
+        self._height1 = height1
+        self._height2 = height2
+
+    def __repr__(self):
+        return f'ISOEnterKey({self._keycode}, {self._width1}, {self._width2}, {self._height1}, {self._height2})'
+
+    def keys(self):
+        return 1
+
+    def _points(self, p_deltas, margin):
+        p, deltas = p_deltas[0], p_deltas[1:]
+        points = [(p[0] + margin[0][0], p[1] + margin[0][1])]
+        for ((dx, dy), (mx, my)) in zip(deltas, margin[1:]):
+            p = (p[0]+dx, p[1]+dy)
+            points.append((p[0] + mx, p[1] + my))
+        return tuple(points)
+
+    def compile(self, ctx, keys):
+        width1 = self._width1*ctx.scale
+        width2 = self._width2*ctx.scale
+        height1 = self._height1*ctx.scale
+        height2 = self._height2*ctx.scale
+        points = self._points(
+            [(ctx.x, ctx.y), (width1, 0), (0, height1+height2), (-width2, 0), (0, -height2), (-width1+width2, 0), (0, -height1)],
+            [(ctx.m, ctx.m), (-ctx.m, ctx.m), (-ctx.m, -ctx.m), (ctx.m, -ctx.m), (ctx.m, -ctx.m), (ctx.m, -ctx.m), (ctx.m, ctx.m)],
+        )
+        keys.append(KeyGeometry(
+            self._keycode, 'polygon', ctx.x, ctx.y, width1, height1+height2, points, ctx.x + width1/2, ctx.y + height1/2,
+            '<polygon class="bg" points="{}"/>'.format(' '.join(f'{x},{y}' for x, y in points)),
+        ))
+        return width1+width2, height1+height2
+
+
+class Space(LayoutNode):
+    def __init__(self, width=1, *, height=1):
+        self._width = width
+        self._height = height
+
+    def __repr__(self):
+        args = []
+        if self._width != 1:
+            args.append(f'width={self._width}')
+        if self._height != 1:
+            args.append(f'height={self._height}')
+        return f'Space({", ".join(args)})'
+
+    def keys(self):
+        return 0
+
+    def compile(self, ctx, keys):
+        return self._width*ctx.scale, self._height*ctx.scale
+
+
+class Row(LayoutNode):
+    def __init__(self, children):
+        self._children = children
+
+    def __repr__(self):
+        return f'Row({", ".join(repr(child) for child in self._children)})'
+
+    def keys(self):
+        return sum(child.keys() for child in self._children)
+
+    def compile(self, ctx, keys):
+        width, height = self._children[0].compile(ctx, keys)
+        total_width = width
+        for child in self._children[1:]:
+            child_width, child_height = child.compile(ctx.shift(width, 0), keys)
+            if child_height != height:
+                raise ValueError('Children have different heights: {} (height: {}) and {} (height: {})'.format(self._children[0], height, child, child_height))
+            total_width += child_width
+            ctx = ctx.shift(child_width, 0)
+        return total_width, height
+
+
+class TwoRowsISOEnter(LayoutNode):
+    def __init__(self, row1, row2, label, width1, width2):
+        self._row1 = row1
+        self._row2 = row2
+        self._label = label
+        self._width1 = width1
+        self._width2 = width2
+
+    def __repr__(self):
+        return f'TwoRowsISOEnter({self._row1}, {self._row2}, {self._width1}, {self._width2})'
+
+    def keys(self):
+        return self._row1.keys() + self._row2.keys() + 1
+
+    def compile(self, ctx, keys):
+        row1_width, row1_height = self._row1.compile(ctx, keys)
+        row2_width, row2_height = self._row2.compile(ctx.shift(0, row1_height), keys)
+        total_row1_width = row1_width + self._width1*ctx.scale
+        total_row2_width = row2_width + self._width2*ctx.scale
+        if total_row1_width != total_row2_width:
+            raise ValueError('Rows have different widths: {}+{} (width: {}) and {}+{} (width: {})'.format(row1_width, self._width1*ctx.scale, total_row1_width, row2_width, self._width2*ctx.scale, total_row2_width))
+        enter_key = ISOEnterKey(self._label, self._width1, self._width2, row1_height/ctx.scale, row2_height/ctx.scale)
+        enter_key.compile(ctx.shift(row1_width, 0), keys)
+        return total_row1_width, row1_height + row2_height
+
+
+class TwoRowsKey(LayoutNode):
+    def __init__(self, row1, row2, label):
+        self._row1 = row1
+        self._row2 = row2
+        self._label = label
+
+    def __repr__(self):
+        return f'TwoRowsKey({self._row1}, {self._row2}, {self._label})'
+
+    def keys(self):
+        return self._row1.keys() + self._row2.keys() + 1
+
+    def compile(self, ctx, keys):
+        row1_width, row1_height = self._row1.compile(ctx, keys)
+        row2_width, row2_height = self._row2.compile(ctx.shift(0, row1_height), keys)
+        if row1_width != row2_width:
+            raise ValueError('Rows have different widths: {} (width: {}) and {} (width: {})'.format(self._row1, row1_width, self._row2, row2_width))
+        key_width, key_height = Key(self._label, height=(row1_height+row2_height)/ctx.scale).compile(ctx.shift(row1_width, 0), keys)
+        return row1_width + key_width, row1_height + row2_height
+
+
+class VBlock(LayoutNode):
+    def __init__(self, children):
+        self._children = children
+
+    def __repr__(self):
+        return f'VBlock({", ".join(repr(child) for child in self._children)})'
+
+    def keys(self):
+        return sum(child.keys() for child in self._children)
+
+    def compile(self, ctx, keys):
+        width, height = self._children[0].compile(ctx, keys)
+        total_height = height
+        for child in self._children[1:]:
+            child_width, child_height = child.compile(ctx.shift(0, height), keys)
+            if child_width != width:
+                raise ValueError('Children have different widths: {} (width: {}) and {} (width: {})'.format(self._children[0], width, child, child_width))
+            total_height += child_height
+            ctx = ctx.shift(0, child_height)
+        return width, total_height
+
+
+class HBlock(LayoutNode):
+    def __init__(self, *children):
+        self._children = children
+
+    def __repr__(self):
+        return f'HBlock({", ".join(repr(child) for child in self._children)})'
+
+    def keys(self):
+        return sum(child.keys() for child in self._children)
+
+    def compile(self, ctx, keys):
+        width, height = self._children[0].compile(ctx, keys)
+        total_width = width
+        for child in self._children[1:]:
+            child_width, child_height = child.compile(ctx.shift(width, 0), keys)
+            if child_height != height:
+                raise ValueError('Children have different heights: {} (height: {}) and {} (height: {})'.format(self._children[0], height, child, child_height))
+            total_width += child_width
+            ctx = ctx.shift(child_width, 0)
+        return total_width, height
+
+
+_keysym_ids = {}
+_keysym_names = []
+
+
+def intern_keysym(keysym):
+    keysym_id = _keysym_ids.get(keysym)
+    if keysym_id is None:
+        keysym_id = _keysym_ids[keysym] = len(_keysym_names)
+        _keysym_names.append(keysym)
+    return keysym_id
+
+
+def keysym_name(keysym_id):
+    return _keysym_names[keysym_id]
+
+
+_fill_ids = {}
+_fills = []
+
+
+def intern_fill(keysym_ids):
+    """Intern a tuple of keysym IDs that repeats over the columns of a keycode."""
+    fill_id = _fill_ids.get(keysym_ids)
+    if fill_id is None:
+        fill_id = _fill_ids[keysym_ids] = len(_fills)
+        _fills.append(keysym_ids)
+    return fill_id
+
+
+# VoidSymbol is interned first, so its ID is 0 in every process.
+VOID_SYMBOL = intern_keysym('VoidSymbol')
+VOID_FILL = intern_fill((VOID_SYMBOL,))
+
+
+def _bind(entry, bindings):
+    """Return entry with the {column: keysym ID} bindings set on top of it."""
+    width, fill_id, columns, ids = entry
+    last = max(bindings)
+    if last < width and bindings.keys().isdisjoint(columns):
+        # Columns that are not set yet are appended.
+        return (width, fill_id, columns + tuple(bindings), ids + tuple(bindings.values()))
+    columns = dict(zip(columns, ids))
+    if last >= width:
+        if fill_id != VOID_FILL:
+            fill = _fills[fill_id]
+            for i in range(width):
+                columns.setdefault(i, fill[i % len(fill)])
+            fill_id = VOID_FILL
+        width = last + 1
+    columns.update(bindings)
+    return (width, fill_id, tuple(columns), tuple(columns.values()))
+
+
+class Keymap:
+    """A parsed keymap.
+
+    Keysyms are interned into integer IDs. For every keycode only the width of
+    its keysym list, an interned fill (a run of keysyms repeated over all
+    columns) and the columns that differ from it are stored; the columns of
+    all keycodes share the same pair of arrays. entries maps keycodes to
+    (width, fill ID, columns, IDs) entries, whose columns and IDs are
+    parallel sequences. strings maps function keysyms to the strings they
+    send and compose is the keymap's ComposeTable.
+    """
+
+    def __init__(self, entries=None, *, columns=range(256), files=(), strings=None, compose=None):
+        self.columns = array('H', columns)
+        self.files = tuple(files)
+        self.strings = dict(strings or {})
+        self.compose = compose if compose is not None else ComposeTable()
+        self._typing_index = None
+        entries = entries or {}
+        self._index = dict(zip(entries, range(len(entries))))
+        widths, fills, columns, ids = zip(*entries.values()) if entries else ((), (), (), ())
+        self._widths = array('H', widths)
+        self._fills = array('I', fills)
+        # Arrays are filled faster from lists than from iterators.
+        self._offsets = array('I', list(accumulate(map(len, columns), initial=0)))
+        self._columns = array('H', list(chain.from_iterable(columns)))
+        self._ids = array('I', list(chain.from_iterable(ids)))
+
+    def __repr__(self):
+        return f'<Keymap: {len(self)} keycodes, {len(self.columns)} columns>'
+
+    def nbytes(self):
+        """Estimate the memory used by the keymap, without the shared keysym and fill tables."""
+        arrays = (self.columns, self._widths, self._fills, self._offsets, self._columns, self._ids)
+        strings = sys.getsizeof(self.strings) + sum(sys.getsizeof(text) for text in self.strings.values())
+        return sys.getsizeof(self._index) + sum(sys.getsizeof(a) for a in arrays) + strings + self.compose.nbytes()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, code):
+        return code in self._index
+
+    def entry(self, code):
+        i = self._index[code]
+        start, end = self._offsets[i], self._offsets[i+1]
+        return [self._widths[i], self._fills[i], self._columns[start:end], self._ids[start:end]]
+
+    def entries(self):
+        return {code: self.entry(code) for code in self._index}
+
+    def keysym(self, code, column):
+        i = self._index.get(code)
+        if i is None or column >= self._widths[i]:
+            return 'VoidSymbol'
+        for j in range(self._offsets[i], self._offsets[i+1]):
+            if self._columns[j] == column:
+                return _keysym_names[self._ids[j]]
+        fill = _fills[self._fills[i]]
+        return _keysym_names[fill[column % len(fill)]]
+
+    def keysyms(self, code):
+        i = self._index.get(code)
+        if i is None:
+            return []
+        width = self._widths[i]
+        fill = [_keysym_names[keysym_id] for keysym_id in _fills[self._fills[i]]]
+        keysyms = (fill*(width//len(fill) + 1))[:width]
+        for j in range(self._offsets[i], self._offsets[i+1]):
+            keysyms[self._columns[j]] = _keysym_names[self._ids[j]]
+        return keysyms
+
+    def get(self, code, default=None):
+        if code not in self._index:
+            return default
+        return self.keysyms(code)
+
+    def typing_index(self):
+        """Return the TypingIndex of the keymap, built on first use."""
+        if self._typing_index is None:
+            self._typing_index = TypingIndex(self)
+        return self._typing_index
+
+
+def compose_text(symbol):
+    """Return the text of a compose symbol: a character as is, the character typed by a keysym, or else its label."""
+    if len(symbol) == 1:
+        return symbol
+    character = keysym_character(symbol)
+    return character if character is not None else resolve_keysym(symbol).label
+
+
+class ComposeTable:
+    """Compose sequences indexed as a two-level trie: {first: {second: result}}.
+
+    Symbols are stored as the text they produce, so sequences written with
+    keysym names or Unicode keysyms are found by their characters. Tables are
+    immutable, so a table can be shared by every keymap loaded from the same
+    overlay.
+    """
+
+    def __init__(self, sequences=()):
+        self._trie = {}
+        self._add(sequences)
+
+    def _add(self, sequences):
+        for first, second, result in sequences:
+            self._trie.setdefault(compose_text(first), {})[compose_text(second)] = compose_text(result)
+        self._len = sum(len(seconds) for seconds in self._trie.values())
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for first, seconds in self._trie.items():
+            for second, result in seconds.items():
+                yield first, second, result
+
+    def nbytes(self):
+        """Estimate the memory used by the table, without the shared strings."""
+        return sys.getsizeof(self._trie) + sum(sys.getsizeof(seconds) for seconds in self._trie.values())
+
+    def lookup(self, first, second):
+        """Return the result of composing first and second, or None."""
+        seconds = self._trie.get(first)
+        return seconds.get(second) if seconds is not None else None
+
+    def completions(self, first):
+        """Return {second: result} for the sequences starting with first."""
+        return dict(self._trie.get(first, ()))
+
+    def merged(self, sequences):
+        """Return a new table with sequences added on top of this one."""
+        table = ComposeTable()
+        table._trie = {first: dict(seconds) for first, seconds in self._trie.items()}
+        table._add(sequences)
+        return table
+
+
+def default_keycode_keysyms(x, X, selected_columns):
+    fill = _letter_fill(x, X)
+    width = selected_columns[-1] + 1
+    if width > 16*len(_fills[fill]):
+        raise ValueError(f'Column {selected_columns[-1]} is out of range -- only {16*len(_fills[fill])} keysyms are defined')
+    if len(selected_columns) == width:
+        # Every column is selected, and tuples are hashed again on every lookup.
+        return (width, fill, (), ())
+    return (width, fill) + _void_columns(selected_columns)
+
+
+@lru_cache(maxsize=None)
+def _letter_fill(x, X):
+    """Return the interned fill of a keycode defined by the letter x alone, X being its other case."""
+    control = f'Control_{x.lower()}'
+    keysyms = [
+        f'+{x}', f'+{X}', f'+{x}', f'+{X}',
+        control, control, control, control,
+        f'Meta_{x}', f'Meta_{X}', f'Meta_{x}', f'Meta_{X}',
+        f'Meta_{control}', f'Meta_{control}', f'Meta_{control}', f'Meta_{control}',
+    ]
+    return intern_fill(tuple(intern_keysym(keysym) for keysym in keysyms))
+
+
+@lru_cache(maxsize=None)
+def _void_columns(selected_columns):
+    """Return the columns below the last selected one that are not selected, and as many VoidSymbol IDs."""
+    selected = set(selected_columns)
+    columns = tuple(column for column in range(selected_columns[-1] + 1) if column not in selected)
+    return columns, (VOID_SYMBOL,)*len(columns)
+
+
+def expand_one_keysym(keysym, selected_columns):
+    """Return the (width, fill, columns, IDs) definition of a keycode defined by a single keysym.
+
+    selected_columns is a tuple of the declared columns, and columns and IDs
+    are parallel tuples of the columns that differ from the fill and their
+    keysym IDs.
+    """
+    c = keysym
+    if c.startswith('+'):
+        c = c[1:]
+    if len(c) == 1 and 'A' <= c <= 'Z':
+        return default_keycode_keysyms(c, c.lower(), selected_columns)
+    if len(c) == 1 and 'a' <= c <= 'z':
+        return default_keycode_keysyms(c, c.upper(), selected_columns)
+    return (selected_columns[-1] + 1, intern_fill((intern_keysym(keysym),)), (), ())
+
+
+INCLUDE_PATH = ['keymaps']
+
+
+class KeymapError(ValueError):
+    """An error in a keymap, with the file, line and column it was found at when they are known."""
+
+    def __init__(self, message, filename=None, line=None, column=None):
+        super().__init__(message, filename, line, column)
+        self.message = message
+        self.filename = filename
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        location = ':'.join(str(part) for part in (self.filename, self.line, self.column) if part is not None)
+        return f'{location}: {self.message}' if location else self.message
+
+
+class IncludeError(KeymapError):
+    """An include that cannot be resolved."""
+
+
+class KeymapOverlay:
+    """The parsed contents of one keymap file, ready to be applied to a keymap.
+
+    entries maps keycodes, in the order they are applied, to a (width, fill
+    ID, columns, IDs) definition that replaces the whole keycode, or to None
+    to keep the existing one; the columns and IDs of a definition are
+    parallel tuples sorted by column. bindings maps some of the keycodes to
+    the {column: keysym ID} bindings set on top of their definitions.
+    strings holds the (keysym, string) pairs of the function keys and
+    compose the (first, second, result) compose sequences. includes holds
+    the (directory, name, path) triples of the includes of every file the
+    overlay was parsed from, with the path each name was found at. Overlays
+    are immutable, so a cached overlay can be applied to any number of
+    keymaps.
+    """
+
+    def __init__(self, entries, bindings, columns, dependencies, strings=(), compose=(), includes=()):
+        self.entries = entries
+        self.bindings = bindings
+        self.columns = columns
+        self.dependencies = dependencies
+        self.includes = includes
+        self.strings = strings
+        self.compose = compose
+        self._compose_table = None
+
+    def compose_table(self):
+        """Return the overlay's compose sequences as a ComposeTable, built once and shared."""
+        if self._compose_table is None:
+            self._compose_table = ComposeTable(self.compose)
+        return self._compose_table
+
+    def apply(self, entries):
+        """Apply the overlay to the {keycode: (width, fill ID, columns, IDs)} entries of a Keymap.
+
+        The entries stay the overlay's own definitions until a column is set
+        on top of them.
+        """
+        for code, definition in self.entries.items():
+            if definition is not None:
+                entries[code] = definition
+            elif code not in entries:
+                entries[code] = (0, VOID_FILL, (), ())
+        for code, code_bindings in self.bindings.items():
+            entries[code] = _bind(entries[code], code_bindings)
+        return entries
+
+
+_parsed_keymaps = {}
+
+
+def _file_stamp(filename):
+    st = os.stat(filename)
+    return st.st_mtime_ns, st.st_size
+
+
+# The modules that open compressed keymaps, by file suffix.
+DECOMPRESSORS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}
+
+
+def open_keymap(filename):
+    """Open a keymap for reading, decompressing .gz, .bz2 and .xz files line by line as they are read."""
+    module = DECOMPRESSORS.get(os.path.splitext(filename)[1])
+    if module is None:
+        return open(filename, 'r', encoding='latin1')
+    import importlib
+
+    return importlib.import_module(module).open(filename, 'rt', encoding='latin1')
+
+
+def find_include(name, directory, include_path):
+    """Return the real path of an included keymap, looked up in directory, the real directory of the including file, and then in include_path.
+
+    Like loadkeys, the name is tried as it is before .inc is appended, each
+    with the suffixes of compressed files.
+    """
+    suffixes = [stem + suffix for stem in ('', '.inc') for suffix in ['', *DECOMPRESSORS]]
+    for include_dir in [directory] + list(include_path):
+        for suffix in suffixes:
+            candidate = os.path.join(include_dir, name + suffix)
+            if os.path.isfile(candidate):
+                # A plain name in a real directory is real unless it is a link.
+                if include_dir is directory and os.sep not in name and not os.path.islink(candidate):
+                    return candidate
+                return os.path.realpath(candidate)
+    raise IncludeError(f'Cannot find included keymap: {name} (searched in {", ".join([directory] + list(include_path))})')
+
+
+KEYMAP_CACHE_VERSION = 9
+
+
+def _content_hash(filename):
+    import hashlib
+
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _keymap_cache_file(cache_dir, path, include_path):
+    """Return the cache file of a keymap, named after its path, its include path and a hash of its contents.
+
+    Where its includes are found and what they contain is stored in the
+    cache file and checked when it is read.
+    """
+    import hashlib
+
+    key = '\0'.join([path] + [os.path.abspath(include_dir) for include_dir in include_path])
+    digest = hashlib.sha256(f'{KEYMAP_CACHE_VERSION}\0'.encode('utf-8'))
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+    # Cache files of the same keymap share the first half of their names.
+    return os.path.join(cache_dir, f'{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}-{digest.hexdigest()[:32]}.keymap')
+
+
+def _dump_overlay(overlay):
+    """Serialize an overlay as it is, with the keysym and fill tables its IDs index into."""
+    import marshal
+
+    definitions = [definition for definition in overlay.entries.values() if definition is not None]
+    fills = tuple(_fills[:max((definition[1] for definition in definitions), default=VOID_FILL) + 1])
+    keysym_ids = [keysym_id for fill in fills for keysym_id in fill]
+    for definition in definitions:
+        keysym_ids.extend(definition[3])
+    for code_bindings in overlay.bindings.values():
+        keysym_ids.extend(code_bindings.values())
+    names = tuple(_keysym_names[:max(keysym_ids) + 1])
+    hashes = tuple((dep, _content_hash(dep)) for dep, stamp in overlay.dependencies)
+    return marshal.dumps((KEYMAP_CACHE_VERSION, hashes, overlay.includes, overlay.columns, names, fills, overlay.entries, overlay.bindings, overlay.strings, overlay.compose))
+
+
+def _intern_cached(values, table, intern):
+    """Intern the keysyms or fills of a cached table and return their IDs, or None if their IDs are their indexes."""
+    if table[:len(values)] == list(values[:len(table)]):
+        # The values that the table does not start with are new, and
+        # interned as its next IDs.
+        for value in values[len(table):]:
+            intern(value)
+        return None
+    return list(map(intern, values))
+
+
+def _load_overlay(data, include_path):
+    """Deserialize an overlay, or return None if any of the files it was parsed from have changed since or one of its includes is now found elsewhere.
+
+    The keysym and fill IDs of the overlay are those of the process that
+    wrote it. They are only mapped to the IDs of this one if its tables do
+    not start with the same keysyms and fills, as they do when both interned
+    them in the same order.
+    """
+    import marshal
+
+    data = marshal.loads(data)
+    if data[0] != KEYMAP_CACHE_VERSION:
+        return None
+    version, hashes, includes, columns, names, fills, entries, bindings, strings, compose = data
+    try:
+        if any(find_include(name, directory, include_path) != path for directory, name, path in includes):
+            return None
+    except IncludeError:
+        return None
+    dependencies = []
+    for dep, digest in hashes:
+        stamp = _file_stamp(dep)
+        if _content_hash(dep) != digest:
+            return None
+        dependencies.append((dep, stamp))
+
+    ids = _intern_cached(names, _keysym_names, intern_keysym)
+    if ids is not None:
+        fills = tuple(tuple(ids[i] for i in fill) for fill in fills)
+    fill_ids = _intern_cached(fills, _fills, intern_fill)
+
+    def definition_entry(definition):
+        width, fill_id, columns, keysym_ids = definition
+        if ids is not None:
+            keysym_ids = tuple(ids[keysym_id] for keysym_id in keysym_ids)
+        return (width, fill_id if fill_ids is None else fill_ids[fill_id], columns, keysym_ids)
+
+    if ids is not None or fill_ids is not None:
+        entries = {code: None if definition is None else definition_entry(definition) for code, definition in entries.items()}
+    if ids is not None:
+        bindings = {code: {column: ids[keysym_id] for column, keysym_id in code_bindings.items()} for code, code_bindings in bindings.items()}
+    return KeymapOverlay(entries, bindings, columns, tuple(dependencies), strings, compose, includes)
+
+
+def _read_cached_overlay(cache_file, include_path):
+    try:
+        with open(cache_file, 'rb') as f:
+            return _load_overlay(f.read(), include_path)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_cached_overlay(cache_file, overlay):
+    """Write an overlay to its cache file and remove the older cache files of the same keymap, whose contents have changed since."""
+    import glob
+    import tempfile
+
+    try:
+        data = _dump_overlay(overlay)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, cache_file)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        prefix = cache_file[:cache_file.rindex('-') + 1]
+        for old in glob.glob(glob.escape(prefix) + '*.keymap'):
+            if old != cache_file:
+                os.unlink(old)
+    except OSError:
+        pass
+
+
+_keymap_sources = {}
+
+# The modifiers that select the column of a binding, by their names in keymaps.
+MODIFIERS = {
+    'plain': 0,
+    'shift': 1,
+    'altgr': 2,
+    'control': 4,
+    'alt': 8,
+    'shiftl': 16,
+    'shiftr': 32,
+    'ctrll': 64,
+    'ctrlr': 128,
+    'capsshift': 256,
+}
+
+# The function key strings of 'strings as usual', as loadkeys defines them.
+USUAL_STRINGS = {
+    **{f'F{i}': f'\033[[{c}' for i, c in enumerate('ABCDE', 1)},
+    **{f'F{i}': f'\033[{n}~' for i, n in enumerate([17, 18, 19, 20, 21, 23, 24, 25, 26, 28, 29, 31, 32, 33, 34], 6)},
+    **{name: f'\033[{n}~' for n, name in enumerate(['Find', 'Insert', 'Remove', 'Select', 'Prior', 'Next'], 1)},
+}
+
+# The Latin-1 compose sequences of 'compose as usual', as loadkeys defines
+# them: the first two characters of every word compose to the third.
+USUAL_COMPOSE = {(word[0], word[1]): word[2] for word in (
+    '`AÀ `aà \'AÁ \'aá ^AÂ ^aâ ~AÃ ~aã "AÄ "aä OAÅ oaå 0AÅ 0aå AAÅ aaå AEÆ aeæ ,CÇ ,cç '
+    '`EÈ `eè \'EÉ \'eé ^EÊ ^eê "EË "eë `IÌ `iì \'IÍ \'ií ^IÎ ^iî "IÏ "iï -DÐ -dð ~NÑ ~nñ '
+    '`OÒ `oò \'OÓ \'oó ^OÔ ^oô ~OÕ ~oõ "OÖ "oö /OØ /oø `UÙ `uù \'UÚ \'uú ^UÛ ^uû "UÜ "uü '
+    '\'YÝ \'yý THÞ thþ ssß "yÿ szß ijÿ'
+).split()}
+
+
+@lru_cache(maxsize=None)
+def _regex(pattern):
+    """Return the compiled pattern, compiled when it is first needed rather than on import.
+
+    argparse imports re in every run of the command line tool, so only the
+    compilation is saved there.
+    """
+    import re
+
+    return re.compile(pattern)
+
+
+# A token of a keymap line, after any whitespace: a string, a character
+# literal, '=' or ',', a word or a comment. A quote that does not start a
+# complete literal is a token on its own.
+_KEYMAP_TOKEN = r"""\s*("(?:[^"\\]|\\.)*"|'(?:[^\\]|\\(?:[0-7]{1,3}|.))'|[=,]|[^\s"'=,#!]+|[#!].*|\S)"""
+_KEYMAP_ESCAPE = r'\\([0-7]{1,3}|.)'
+
+
+def keymap_tokens(line):
+    """Return the tokens of a keymap line, as matched by _KEYMAP_TOKEN, without its comment.
+
+    Lines are split on whitespace instead when every word is a plain word,
+    '=', ',' or a string or character literal without spaces or escaped
+    quotes. parse_keymap_source() splits the lines without quotes, commas
+    and comments itself.
+    """
+    tokens = line.split()
+    for token in tokens:
+        if token.isalnum() or token == '=' or token == ',':
+            continue
+        if token[0] == "'":
+            if len(token) == 3 and token[2] == "'" and token[1] != '\\' or len(token) == 4 and token[3] == "'" and token[1] == '\\':
+                continue
+        elif token[0] == '"':
+            if len(token) > 1 and token[-1] == '"' and '"' not in token[1:-1] and token[-2] != '\\':
+                continue
+        elif not ('"' in token or "'" in token or '=' in token or ',' in token or '#' in token or '!' in token):
+            continue
+        tokens = _regex(_KEYMAP_TOKEN).findall(line)
+        if tokens and tokens[-1][0] in '#!':
+            tokens.pop()
+        break
+    return tokens
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape[0] in '01234567':
+        return chr(int(escape, 8))
+    return '\n' if escape == 'n' else escape
+
+
+def keymap_literal(token):
+    """Return the text of a string or character literal token, with its escapes decoded."""
+    return _regex(_KEYMAP_ESCAPE).sub(_unescape, token[1:-1])
+
+
+@lru_cache(maxsize=None)
+def _charset_character(value, charset):
+    """Decode a character literal, read as Latin-1, as a byte of charset."""
+    return value.encode('latin1').decode(charset)
+
+
+class _TokenError(ValueError):
+    """A syntax error at the token-th token of a line."""
+
+    def __init__(self, message, token):
+        super().__init__(message)
+        self.token = token
+
+
+def parse_keymap_source(path):
+    """Parse a single keymap file without following its includes.
+
+    Return the file's stamp, its declared columns, its segments and its
+    errors. Segments are the (name, line, column) of the included files and,
+    around them, [entries, bindings, strings, compose] blocks of the
+    definitions in between: entries maps keycodes to the definition of
+    their last keycode line, or to None if they only have bindings,
+    bindings maps keycodes to the {column: keysym ID} bindings set on top of
+    it, strings keysyms to their strings and compose (first, second) pairs
+    to their results. Character literals are decoded with the declared
+    charset. The file is read in a single pass: continued lines are joined
+    as they are read, every line is split by keymap_tokens() and dispatched
+    on its first token, and the keysyms of keycode lines are interned as
+    they are read. Lines with errors are skipped and reported as
+    KeymapErrors. Sources are cached until the file changes, so only the
+    changed files of an include tree are parsed again.
+    """
+    cached = _keymap_sources.get(path)
+    if cached is not None and cached[0] == _file_stamp(path):
+        return cached
+
+    columns = tuple(range(256))
+    entries = {}
+    bindings = {}
+    block_strings = {}
+    block_compose = {}
+    segments = [[entries, bindings, block_strings, block_compose]]
+    charset = None
+    column_prefixes = {}
+    compose_characters = {}
+    stamp = _file_stamp(path)
+    errors = []
+
+    def token(tokens, i, expected):
+        if i >= len(tokens):
+            raise _TokenError(f'Expected {expected} at the end of the line', i)
+        return tokens[i]
+
+    def number(tokens, i, expected='a keycode'):
+        value = token(tokens, i, expected)
+        try:
+            if value[:2] in ('0x', '0X'):
+                return int(value[2:], 16)
+            if len(value) > 1 and value[0] == '0':
+                return int(value[1:], 8)
+            return int(value)
+        except ValueError:
+            raise _TokenError(f'Expected {expected}, found {value}', i) from None
+
+    def literal(tokens, i, expected, quote):
+        value = token(tokens, i, expected)
+        if value[0] != quote or len(value) < 2:
+            raise _TokenError(('Unterminated string' if quote == '"' else 'Unterminated character') if value == quote else f'Expected {expected}, found {value}', i)
+        return keymap_literal(value) if '\\' in value else value[1:-1]
+
+    def end(tokens, i):
+        if i < len(tokens):
+            raise _TokenError(f'Unexpected {tokens[i]}', i)
+
+    def expect(tokens, i, expected):
+        if token(tokens, i, f"'{expected}'") != expected:
+            raise _TokenError(f"Expected '{expected}', found {tokens[i]}", i)
+
+    def keysym(tokens, i):
+        value = token(tokens, i, 'a keysym')
+        if value[0] in '"\'=,':
+            raise _TokenError(f'Expected a keysym, found {value}', i)
+        return value
+
+    def include(tokens):
+        name = token(tokens, 1, 'a file name')
+        if name[0] == '"':
+            name = literal(tokens, 1, 'a file name', '"')
+        elif name[0] in '\'=,':
+            raise _TokenError(f'Expected a file name, found {name}', 1)
+        end(tokens, 2)
+        return name
+
+    def keycode(tokens):
+        if len(tokens) > 2 and tokens[2] == '=' and tokens[1].isdigit() and tokens[1][0] != '0':
+            code = int(tokens[1])
+        else:
+            code = number(tokens, 1)
+            expect(tokens, 2, '=')
+        if len(tokens) > 4:
+            keysyms = tokens[3:]
+            if len(keysyms) > len(columns):
+                raise _TokenError(f'Too many keysyms for keycode {code}: {len(keysyms)} keysyms, but only {len(columns)} keymaps are declared', 3 + len(columns))
+            # Only valid keysyms are interned, so keysyms that are all found
+            # need no check.
+            try:
+                ids = itemgetter(*keysyms)(_keysym_ids)
+            except KeyError:
+                for i, value in enumerate(keysyms, 3):
+                    if value[0] in '"\'=,':
+                        keysym(tokens, i)
+                ids = tuple(map(intern_keysym, keysyms))
+            code_columns = column_prefixes.get(len(ids))
+            if code_columns is None:
+                code_columns = column_prefixes[len(ids)] = columns[:len(ids)]
+            if VOID_SYMBOL in ids:
+                # VoidSymbol columns are left to the fill. Its ID is 0, so
+                # the IDs select the other columns themselves.
+                code_columns = tuple(compress(code_columns, ids))
+                ids = tuple(filter(None, ids))
+            definition = (columns[-1] + 1, VOID_FILL, code_columns, ids)
+        elif len(tokens) == 4:
+            definition = expand_one_keysym(keysym(tokens, 3), columns)
+        else:
+            definition = (0, VOID_FILL, (), ())
+        entries[code] = definition
+        if code in bindings:
+            del bindings[code]
+
+    def binding(tokens):
+        column = 0
+        i = 0
+        while tokens[i] in MODIFIERS:
+            column |= MODIFIERS[tokens[i]]
+            i += 1
+            if i == len(tokens):
+                raise _TokenError("Expected a modifier or 'keycode' at the end of the line", i)
+        if tokens[i] != 'keycode':
+            raise _TokenError(f"Expected a modifier or 'keycode', found {tokens[i]}", i)
+        if len(tokens) == i + 4 and tokens[i + 2] == '=' and tokens[i + 1].isdigit() and tokens[i + 1][0] != '0' and tokens[i + 3][0] not in '"\'=,':
+            code = int(tokens[i + 1])
+            keysym_id = intern_keysym(tokens[i + 3])
+        else:
+            code = number(tokens, i + 1)
+            expect(tokens, i + 2, '=')
+            keysym_id = intern_keysym(keysym(tokens, i + 3))
+            end(tokens, i + 4)
+        code_bindings = bindings.get(code)
+        if code_bindings is not None:
+            code_bindings[column] = keysym_id
+        else:
+            bindings[code] = {column: keysym_id}
+            if code not in entries:
+                entries[code] = None
+
+    def keymaps(tokens):
+        nonlocal columns
+        declared = []
+        i = 1
+        while True:
+            column_range = token(tokens, i, 'a keymap range')
+            start, dash, stop = column_range.partition('-')
+            try:
+                start = int(start)
+                stop = int(stop) if dash else start
+            except ValueError:
+                raise _TokenError(f'Expected a keymap range, found {column_range}', i) from None
+            if start > stop:
+                raise _TokenError(f'Empty keymap range: {column_range}', i)
+            if declared and start <= declared[-1]:
+                raise _TokenError(f'Keymap ranges are not in increasing order: {column_range}', i)
+            declared.extend(range(start, stop + 1))
+            if i + 1 == len(tokens):
+                break
+            expect(tokens, i + 1, ',')
+            i += 2
+        columns = tuple(declared)
+        column_prefixes.clear()
+
+    def strings(tokens):
+        # Function key strings: string NAME = "..." or strings as usual.
+        if tokens[0] == 'strings':
+            expect(tokens, 1, 'as')
+            expect(tokens, 2, 'usual')
+            end(tokens, 3)
+            block_strings.update(USUAL_STRINGS)
+            return
+        name = keysym(tokens, 1)
+        expect(tokens, 2, '=')
+        block_strings[name] = literal(tokens, 3, 'a string', '"')
+        end(tokens, 4)
+
+    def character(value):
+        # Character literals are bytes of the declared charset.
+        return _charset_character(value, charset) if charset is not None else value
+
+    def compose_symbol(tokens, i):
+        value = token(tokens, i, 'a character')
+        if value[0] == "'":
+            value = literal(tokens, i, 'a character', "'")
+            if len(value) != 1:
+                raise _TokenError(f'Expected a single character, found {tokens[i]}', i)
+            try:
+                value = compose_characters[tokens[i]] = character(value)
+            except ValueError:
+                raise _TokenError(f'Invalid {charset} character: {tokens[i]}', i) from None
+            return value
+        return keysym(tokens, i)
+
+    def compose(tokens):
+        # compose 'a' 'b' to 'c', or compose as usual [for "charset"].
+        if len(tokens) == 5 and tokens[3] == 'to' and tokens[1] != 'as':
+            # Character literals are decoded once per charset.
+            get = compose_characters.get
+            first = get(tokens[1]) or compose_symbol(tokens, 1)
+            second = get(tokens[2]) or compose_symbol(tokens, 2)
+            block_compose[first, second] = get(tokens[4]) or compose_symbol(tokens, 4)
+            return
+        if token(tokens, 1, 'a character') == 'as':
+            expect(tokens, 2, 'usual')
+            if len(tokens) > 3:
+                import codecs
+
+                expect(tokens, 3, 'for')
+                name = literal(tokens, 4, 'a charset', '"')
+                end(tokens, 5)
+                try:
+                    latin1 = codecs.lookup(name).name == 'iso8859-1'
+                except LookupError:
+                    latin1 = False
+                if not latin1:
+                    raise _TokenError(f"Don't know how to compose for {name}", 4)
+            block_compose.update(USUAL_COMPOSE)
+            return
+        first = compose_symbol(tokens, 1)
+        second = compose_symbol(tokens, 2)
+        expect(tokens, 3, 'to')
+        block_compose[first, second] = compose_symbol(tokens, 4)
+        end(tokens, 5)
+
+    def charset_statement(tokens):
+        nonlocal charset
+        import codecs
+
+        name = literal(tokens, 1, 'a charset', '"')
+        end(tokens, 2)
+        try:
+            codec = codecs.lookup(name).name
+        except LookupError:
+            raise _TokenError(f'Unknown charset: {name}', 1) from None
+        charset = None if codec == 'iso8859-1' else codec
+        compose_characters.clear()
+
+    def alt_is_meta(tokens):
+        end(tokens, 1)
+
+    statements = {
+        'keycode': keycode,
+        'keymaps': keymaps,
+        'string': strings,
+        'strings': strings,
+        'compose': compose,
+        'charset': charset_statement,
+        'alt_is_meta': alt_is_meta,
+    }
+    statements.update(dict.fromkeys(MODIFIERS, binding))
+
+    # A line ending with a backslash continues on the next one; pieces holds
+    # the physical lines of a continued line, backslashes included.
+    with open_keymap(path) as f:
+        lines = enumerate(f, 1)
+        for line_number, line in lines:
+            pieces = None
+            if '\\' in line and line.endswith(('\\\n', '\\')):
+                pieces = [line]
+                first_line_number = line_number
+                for line_number, line in lines:
+                    pieces.append(line)
+                    if not line.endswith(('\\\n', '\\')):
+                        break
+                # Only the last line of a file can end without a newline.
+                line = ''.join(pieces).replace('\\\n', '')
+                if line.endswith('\\'):
+                    line = line[:-1]
+                line_number = first_line_number
+            elif line[0] in '#!\n':
+                # Lines that start with a comment or are empty have no tokens.
+                continue
+            if '"' in line or "'" in line or ',' in line or '#' in line or '!' in line:
+                tokens = keymap_tokens(line)
+            else:
+                # Lines without quotes, commas and comments are split on
+                # whitespace once their '=' signs are spaced out.
+                tokens = line.split()
+                n = line.count('=')
+                if n and not (n == 1 and '=' in tokens) and n != tokens.count('='):
+                    tokens = line.replace('=', ' = ').split()
+            if not tokens:
+                continue
+            try:
+                statement = statements.get(tokens[0])
+                if statement is not None:
+                    statement(tokens)
+                elif tokens[0] == 'include':
+                    name = include(tokens)
+                    entries, bindings, block_strings, block_compose = {}, {}, {}, {}
+                    segments.extend([(name,) + _token_location(line, 1, line_number, pieces), [entries, bindings, block_strings, block_compose]])
+                else:
+                    raise _TokenError(f'Unexpected {tokens[0]}', 0)
+            except _TokenError as e:
+                errors.append(KeymapError(str(e), path, *_token_location(line, e.token, line_number, pieces)))
+            except (ValueError, LookupError) as e:
+                errors.append(KeymapError(str(e) or f'Invalid line: {line.strip()}', path, line_number))
+
+    source = _keymap_sources[path] = (stamp, columns, segments, errors)
+    return source
+
+
+def _token_column(line, token):
+    """Return the 1-based column of a line's token-th token, or of the end of the line."""
+    for i, match in enumerate(_regex(_KEYMAP_TOKEN).finditer(line)):
+        if i == token:
+            return match.start(1) + 1
+    return len(line.rstrip()) + 1
+
+
+def _token_location(line, token, line_number, pieces=None):
+    """Return the physical line and column of a token of a line starting at line_number, joined from pieces if it was continued."""
+    offset = _token_column(line, token) - 1
+    for piece in (pieces or ())[:-1]:
+        # Every piece but the last ends with a backslash and a newline.
+        if offset < len(piece) - 2:
+            break
+        offset -= len(piece) - 2
+        line_number += 1
+    return line_number, offset + 1
+
+
+def parse_keymap_file(filename, *, include_path=INCLUDE_PATH, cache_dir=None, errors=None, stats=None, _stack=()):
+    """Parse a keymap file and its includes into a KeymapOverlay.
+
+    Overlays are cached in memory and, with cache_dir, on disk. A cached
+    overlay is used as long as none of the files it was parsed from has
+    changed. The first error in the files raises a KeymapError, unless an
+    errors list is given: then every error is appended to it and the lines
+    and includes in error are skipped.
+    """
+    # Includes are found by find_include() at their real paths already.
+    path = filename if _stack else os.path.realpath(filename)
+    if path in _stack:
+        raise IncludeError('Include cycle: {}'.format(' -> '.join(_stack + (path,))))
+    cache_key = (path, tuple(include_path))
+    overlay = _parsed_keymaps.get(cache_key)
+    if overlay is not None and all(_file_stamp(dep) == stamp for dep, stamp in overlay.dependencies):
+        return overlay
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = _keymap_cache_file(cache_dir, path, include_path)
+        overlay = _read_cached_overlay(cache_file, include_path)
+        if overlay is not None:
+            (stats or NO_STATS).count('keymap_cache_hits')
+            _parsed_keymaps[cache_key] = overlay
+            return overlay
+        (stats or NO_STATS).count('keymap_cache_misses')
+
+    stamp, columns, segments, source_errors = parse_keymap_source(path)
+    if source_errors and errors is None:
+        raise source_errors[0]
+    known_errors = len(errors) if errors is not None else 0
+    if errors is not None:
+        errors.extend(source_errors)
+    entries = {}
+    bindings = {}
+    strings = {}
+    compose = {}
+    dependencies = {path: stamp}
+    includes = []
+    for segment in segments:
+        if isinstance(segment, tuple):
+            name, line_number, column = segment
+            try:
+                with (stats or NO_STATS).phase('includes'):
+                    include = find_include(name, os.path.dirname(path), include_path)
+                    includes.append((os.path.dirname(path), name, include))
+                    included = parse_keymap_file(
+                        include,
+                        include_path=include_path,
+                        cache_dir=cache_dir,
+                        errors=errors,
+                        stats=stats,
+                        _stack=_stack + (path,),
+                    )
+            except IncludeError as e:
+                if e.filename is not None:
+                    raise
+                error = IncludeError(e.message, path, line_number, column)
+                if errors is None:
+                    raise error from None
+                errors.append(error)
+                continue
+            block_entries, block_bindings = included.entries, included.bindings
+            strings.update(included.strings)
+            compose.update(((first, second), result) for first, second, result in included.compose)
+            dependencies.update(included.dependencies)
+            includes.extend(included.includes)
+        else:
+            block_entries, block_bindings, block_strings, block_compose = segment
+            strings.update(block_strings)
+            compose.update(block_compose)
+        if not entries:
+            entries = dict(block_entries)
+            bindings = dict(block_bindings)
+            continue
+        for code, definition in block_entries.items():
+            if definition is not None:
+                entries[code] = definition
+                if code in bindings:
+                    del bindings[code]
+            elif code not in entries:
+                entries[code] = None
+        for code, code_bindings in block_bindings.items():
+            # Blocks and overlays are shared, so their bindings are copied when merged.
+            if code in bindings:
+                code_bindings = {**bindings[code], **code_bindings}
+            bindings[code] = code_bindings
+
+    overlay = KeymapOverlay(
+        entries,
+        bindings,
+        columns,
+        tuple(dependencies.items()),
+        tuple(strings.items()),
+        tuple((first, second, result) for (first, second), result in compose.items()),
+        tuple(dict.fromkeys(includes)),
+    )
+    if errors is not None and len(errors) > known_errors:
+        # Do not cache an overlay with skipped lines or includes.
+        return overlay
+    _parsed_keymaps[cache_key] = overlay
+    if cache_file is not None:
+        _write_cached_overlay(cache_file, overlay)
+    return overlay
+
+
+def clear_caches():
+    """Drop every in-process cache of parsed keymaps, compiled layouts and keysym labels."""
+    _keymap_sources.clear()
+    _parsed_keymaps.clear()
+    _compiled_layouts.clear()
+    resolve_keysym.cache_clear()
+
+
+def load_keymap(filename, *, keymap=None, include_path=INCLUDE_PATH, cache_dir=None, errors=None, stats=None):
+    stats = stats or NO_STATS
+    with stats.phase('keymap'):
+        overlay = parse_keymap_file(filename, include_path=include_path, cache_dir=cache_dir, errors=errors, stats=stats)
+        files = [dep for dep, stamp in overlay.dependencies]
+        if keymap is not None:
+            files = list(keymap.files) + [f for f in files if f not in keymap.files]
+        entries = overlay.apply(keymap.entries() if keymap is not None else {})
+        if keymap is not None:
+            strings = {**keymap.strings, **dict(overlay.strings)}
+            compose = keymap.compose.merged(overlay.compose)
+        else:
+            strings = dict(overlay.strings)
+            compose = overlay.compose_table()
+        keymap = Keymap(entries, columns=overlay.columns, files=files, strings=strings, compose=compose)
+    stats.count_keymap(keymap)
+    return keymap
+
+
+# TODO
+# 84? (Last_Console)
+# 85?
+# 89, ..., 95?
+# 112? (Macro)
+# 113? (F13)
+# 114? (F14)
+# 115? (Help)
+# 116? (Do)
+# 117? (F17)
+# 118? (KP_MinPlus)
+# 119? (Pause)
+# 120, ..., 124?
+
+# Modifier keys
+# Shift 1
+# AltGr 2
+# Control 4
+# Alt 8
+# ShiftL 16
+# ShiftR 32
+# CtrlL 64
+# CtrlR 128
+# CapsShift 256 
+
+class LayoutError(ValueError):
+    """An invalid layout file, with the place in it where the problem was found."""
+
+    def __init__(self, message, filename=None, path=None):
+        super().__init__(message, filename, path)
+        self.message = message
+        self.filename = filename
+        self.path = path
+
+    def __str__(self):
+        location = ':'.join(part for part in (self.filename, self.path) if part)
+        return f'{location}: {self.message}' if location else self.message
+
+
+def _layout_number(data, field, path, default):
+    value = data.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise LayoutError(f'{field} must be a non-negative number', path=path)
+    return value
+
+
+def _layout_keycode(value, path):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < 0x10000:
+        raise LayoutError(f'Invalid keycode: {value!r}', path=path)
+    return value
+
+
+def _layout_children(data, fragments, path, expanding):
+    # expanding is the names of the fragments that data is inside of.
+    if not isinstance(data, list) or not data:
+        raise LayoutError('Expected a non-empty list of nodes', path=path)
+    children = []
+    for i, child in enumerate(data):
+        if isinstance(child, dict) and 'fragment' in child:
+            name = child['fragment']
+            if name not in fragments:
+                raise LayoutError(f'Unknown fragment: {name!r}', path=f'{path}[{i}]')
+            if name in expanding:
+                cycle = expanding[expanding.index(name):] + (name,)
+                raise LayoutError(f'fragment cycle: {" -> ".join(map(str, cycle))}', path=f'{path}[{i}]')
+            children += _layout_children(fragments[name], fragments, f'{path}[{i}].{name}', expanding + (name,))
+        else:
+            children.append(_layout_node(child, fragments, f'{path}[{i}]', expanding))
+    return children
+
+
+def _two_rows(data, fragments, path, expanding):
+    rows = data['two_rows_key' if 'two_rows_key' in data else 'two_rows_iso_enter']
+    if not isinstance(rows, list) or len(rows) != 2:
+        raise LayoutError('Expected two rows', path=path)
+    return [_layout_node(row, fragments, f'{path}[{i}]', expanding) for i, row in enumerate(rows)]
+
+
+# The fields of every kind of layout node, its own first.
+LAYOUT_NODES = {
+    'key': ({'key', 'width', 'height'}, lambda data, fragments, path, expanding: Key(
+        _layout_keycode(data['key'], path), width=_layout_number(data, 'width', path, 1), height=_layout_number(data, 'height', path, 1))),
+    'space': ({'space', 'height'}, lambda data, fragments, path, expanding: Space(
+        _layout_number(data, 'space', path, 1), height=_layout_number(data, 'height', path, 1))),
+    'row': ({'row'}, lambda data, fragments, path, expanding: Row(_layout_children(data['row'], fragments, path + '.row', expanding))),
+    'vblock': ({'vblock'}, lambda data, fragments, path, expanding: VBlock(_layout_children(data['vblock'], fragments, path + '.vblock', expanding))),
+    'hblock': ({'hblock'}, lambda data, fragments, path, expanding: HBlock(*_layout_children(data['hblock'], fragments, path + '.hblock', expanding))),
+    'two_rows_key': ({'two_rows_key', 'keycode'}, lambda data, fragments, path, expanding: TwoRowsKey(
+        *_two_rows(data, fragments, path + '.two_rows_key', expanding), _layout_keycode(data.get('keycode'), path))),
+    'two_rows_iso_enter': ({'two_rows_iso_enter', 'keycode', 'width1', 'width2'}, lambda data, fragments, path, expanding: TwoRowsISOEnter(
+        *_two_rows(data, fragments, path + '.two_rows_iso_enter', expanding), _layout_keycode(data.get('keycode'), path),
+        _layout_number(data, 'width1', path, None), _layout_number(data, 'width2', path, None))),
+}
+
+
+def _layout_node(data, fragments, path, expanding=()):
+    """Build the layout node described by data: a keycode, or an object with the fields of one of LAYOUT_NODES."""
+    if isinstance(data, int) and not isinstance(data, bool):
+        return Key(_layout_keycode(data, path))
+    if not isinstance(data, dict):
+        raise LayoutError('Expected a keycode or a node', path=path)
+    kinds = [kind for kind in LAYOUT_NODES if kind in data]
+    if len(kinds) != 1:
+        raise LayoutError(f'Expected exactly one of {", ".join(LAYOUT_NODES)}', path=path)
+    fields, build = LAYOUT_NODES[kinds[0]]
+    unknown = set(data) - fields
+    if unknown:
+        raise LayoutError(f'Unknown fields of {kinds[0]}: {", ".join(sorted(unknown))}', path=path)
+    return build(data, fragments, path, expanding)
+
+
+def load_layout(filename, *, scale=60):
+    """Load a layout from a JSON file.
+
+    The file has the root node in layout and, in fragments, named lists of
+    nodes that {"fragment": NAME} splices into any list of children. A node
+    is a keycode, or an object such as {"key": 14, "width": 2},
+    {"space": 1, "height": 0.5}, {"row": [...]}, {"vblock": [...]},
+    {"hblock": [...]}, {"two_rows_key": [ROW, ROW], "keycode": 78} or
+    {"two_rows_iso_enter": [ROW, ROW], "keycode": 28, "width1": 1.5,
+    "width2": 1.25}. The layout is compiled at scale, so that rows and blocks
+    that do not line up are reported here, and kept by compile_layout().
+    """
+    import json
+
+    with open(filename, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise LayoutError(str(e), filename) from None
+    try:
+        if not isinstance(data, dict) or 'layout' not in data:
+            raise LayoutError('Expected an object with a layout')
+        fragments = data.get('fragments', {})
+        if not isinstance(fragments, dict):
+            raise LayoutError('fragments must be an object', path='fragments')
+        layout = _layout_node(data['layout'], fragments, 'layout')
+        compile_layout(layout, scale)
+    except LayoutError as e:
+        raise LayoutError(e.message, filename, e.path) from None
+    except ValueError as e:
+        raise LayoutError(str(e), filename) from None
+    return layout
+
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+
+
+class LayoutRegistry:
+    """The layouts of the JSON files in a directory, by name, loaded on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._layouts = {}
+
+    def _filename(self, name):
+        if not name or name.startswith('.') or os.path.basename(name) != name:
+            return None
+        filename = os.path.join(self.directory, name + '.json')
+        return filename if os.path.isfile(filename) else None
+
+    def __getitem__(self, name):
+        layout = self._layouts.get(name)
+        if layout is None:
+            filename = self._filename(name)
+            if filename is None:
+                raise KeyError(name)
+            layout = self._layouts[name] = load_layout(filename)
+        return layout
+
+    def __contains__(self, name):
+        return name in self._layouts or self._filename(name) is not None
+
+    def __iter__(self):
+        return iter(sorted(filename[:-len('.json')] for filename in os.listdir(self.directory) if filename.endswith('.json')))
+
+
+LAYOUTS = LayoutRegistry(LAYOUT_DIR)
+
+# The module attributes of the bundled layouts, loaded from LAYOUTS on first access
+# like LABELS is built by labels_table().
+LAYOUT_ATTRIBUTES = {'ANSI_LAYOUT': 'ansi', 'ISO_LAYOUT': 'iso'}
+
+
+def __getattr__(name):
+    if name == 'LABELS':
+        return labels_table()
+    if name in LAYOUT_ATTRIBUTES:
+        return LAYOUTS[LAYOUT_ATTRIBUTES[name]]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+SCRIPT = """let currentColumn = 0;
+let capsLock = false;
+let keys = [];
+let shown = [];
+let modKeys = [];
+const columnDiffs = {};
+function mod(label) {
+  if (label.endsWith(" LOCK")) {
+    label = label.substring(0, label.length - " LOCK".length);
+  }
+  switch (label) {
+    case "SHIFT": return 1;
+    case "ALTGR": return 2;
+    case "CTRL": return 4;
+    case "ALT": return 8;
+    case "SHIFTL": return 16;
+    case "SHIFTR": return 32;
+    case "CTRLR": return 64;
+    case "CTRLL": return 128;
+    case "CAPSSHIFT": return 256;
+    default: return 0;
+  }
+}
+function escapeXML(s) {
+  return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+}
+function columnDiff(column) {
+  // Map from key index to label index for the keys whose label differs from column 0.
+  let diff = columnDiffs[column];
+  if (diff === undefined) {
+    diff = new Map();
+    const i = labelTable.columns[column];
+    if (i !== undefined) {
+      const pairs = labelTable.diffs[i];
+      for (let j = 0; j < pairs.length; j += 2) {
+        diff.set(pairs[j], pairs[j + 1]);
+      }
+    } else {
+      labelTable.base.forEach((l, k) => {
+        if (l != 0) {
+          diff.set(k, 0);
+        }
+      });
+    }
+    columnDiffs[column] = diff;
+  }
+  return diff;
+}
+function rawLabel(k, column) {
+  const l = columnDiff(column).get(k);
+  return labelTable.labels[l === undefined ? labelTable.base[k] : l];
+}
+function displayLabel(k, column) {
+  let label = rawLabel(k, column);
+  if (label.length > 1 && label[0] == "+") {
+    if (capsLock) {
+      label = rawLabel(k, column ^ 1);
+      if (label.length > 1 && label[0] == "+") {
+        label = label.substring(1);
+      }
+    } else {
+      label = label.substring(1);
+    }
+  }
+  return label;
+}
+function updateActive(k) {
+  const label = shown[k];
+  if (label == "CAPS LOCK") {
+    keys[k].classList.toggle("active", capsLock);
+  } else {
+    const modColumn = mod(label);
+    if (modColumn) {
+      keys[k].classList.toggle("active", (currentColumn & modColumn) != 0);
+    }
+  }
+}
+function setLabel(k, label) {
+  const lbl = keys[k].querySelector(".lbl");
+  if (label.indexOf(" ") != -1) {
+    let tspans = "";
+    label.split(" ").forEach((word, i) => {
+      if (i == 0) {
+        tspans += `<tspan x="${lbl.getAttribute("x")}" dy="0">${escapeXML(word)}</tspan>`;
+      } else {
+        tspans += `<tspan x="${lbl.getAttribute("x")}" dy="1em">${escapeXML(word)}</tspan>`;
+      }
+    });
+    lbl.innerHTML = tspans;
+  } else {
+    lbl.innerHTML = escapeXML(label);
+  }
+}
+function switchColumn(column, caps) {
+  // Only keys listed in the diffs of the old and the new column (and of
+  // their shifted counterparts while caps lock is involved) can change.
+  const columns = [currentColumn, column];
+  if (capsLock || caps) {
+    columns.push(currentColumn ^ 1, column ^ 1);
+  }
+  currentColumn = column;
+  capsLock = caps;
+  const changed = new Set();
+  for (const c of columns) {
+    for (const k of columnDiff(c).keys()) {
+      changed.add(k);
+    }
+  }
+  for (const k of changed) {
+    const label = displayLabel(k, currentColumn);
+    if (label !== shown[k]) {
+      shown[k] = label;
+      setLabel(k, label);
+    }
+    updateActive(k);
+  }
+  for (const k of modKeys) {
+    updateActive(k);
+  }
+}
+function initKey(key, k) {
+  key.addEventListener("click", (e) => {
+    let label = rawLabel(k, currentColumn);
+    if (label == "" && key.classList.contains("mod")) {
+      // The column is not declared by the keymap; the key still works as a modifier.
+      label = rawLabel(k, 0);
+    }
+    if (label == "CAPS LOCK") {
+      switchColumn(currentColumn, !capsLock);
+    } else {
+      const modColumn = mod(label);
+      if (modColumn) {
+        switchColumn(currentColumn ^ modColumn, capsLock);
+      }
+    }
+  });
+}
+window.addEventListener("DOMContentLoaded", () => {
+  keys = Array.from(document.querySelectorAll(".key"));
+  keys.forEach((key, k) => {
+    shown[k] = displayLabel(k, 0);
+    if (key.classList.contains("mod")) {
+      modKeys.push(k);
+    }
+    initKey(key, k);
+  });
+});"""
+
+# Appended to the SVG served by --watch --serve: replaces the keys pushed by
+# the server and shows them in the current column.
+LIVE_SCRIPT = """new EventSource("/events").onmessage = (e) => {
+  const update = JSON.parse(e.data);
+  Object.assign(labelTable, update.table);
+  for (const column in columnDiffs) {
+    delete columnDiffs[column];
+  }
+  for (const [k, fragment] of Object.entries(update.keys)) {
+    const g = document.createElementNS("http://www.w3.org/2000/svg", "g");
+    g.innerHTML = fragment;
+    const key = g.firstElementChild;
+    keys[k].replaceWith(key);
+    keys[k] = key;
+    shown[k] = undefined;
+    initKey(key, Number(k));
+  }
+  modKeys = [];
+  keys.forEach((key, k) => {
+    if (key.classList.contains("mod")) {
+      modKeys.push(k);
+    }
+    const label = displayLabel(k, currentColumn);
+    if (label !== shown[k]) {
+      shown[k] = label;
+      setLabel(k, label);
+    }
+    updateActive(k);
+  });
+};"""
+
+# The script of the --layers output: clicking a modifier only changes the
+# classes of the root element, the stylesheet shows the matching layer.
+LAYERS_SCRIPT = """let currentColumn = 0;
+let capsLock = false;
+function switchColumn(column, caps) {
+  currentColumn = column;
+  capsLock = caps;
+  let classes = "col-" + column;
+  for (let bit = 1; bit <= column; bit <<= 1) {
+    if (column & bit) {
+      classes += " on-" + bit;
+    }
+  }
+  if (caps) {
+    classes += " caps";
+  }
+  document.documentElement.setAttribute("class", classes);
+}
+window.addEventListener("DOMContentLoaded", () => {
+  document.querySelectorAll("[data-mod]").forEach((key) => {
+    // data-mods lists the columns in which the key is another modifier.
+    const mods = JSON.parse(key.getAttribute("data-mods") || "{}");
+    key.addEventListener("click", (e) => {
+      const mod = currentColumn in mods ? mods[currentColumn] : key.getAttribute("data-mod");
+      if (mod == "caps") {
+        switchColumn(currentColumn, !capsLock);
+      } else if (mod) {
+        switchColumn(currentColumn ^ Number(mod), capsLock);
+      }
+    });
+  });
+});"""
+
+
+class Stats:
+    """Wall time per phase and counters, reported by --stats.
+
+    Phases can nest; time spent in a nested phase is attributed to it only,
+    so the phases add up to the total run time.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def count_keymap(self, keymap):
+        keysyms = set()
+        for code in keymap:
+            keysyms.update(keymap.keysyms(code))
+        self.count('keymaps')
+        self.count('included_files', len(keymap.files) - 1)
+        self.count('keycodes', len(keymap))
+        self.count('columns', len(keymap.columns))
+        self.count('unique_keysyms', len(keysyms))
+        self.count('unknown_keysyms', sum(not keysym_known(keysym) for keysym in keysyms))
+
+    def merge(self, report):
+        for name, seconds in report['phases'].items():
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        for name, n in report['counts'].items():
+            self.count(name, n)
+
+    def report(self):
+        return {
+            'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'counts': dict(self.counts),
+        }
+
+
+class NullStats:
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def count_keymap(self, keymap):
+        pass
+
+
+NO_STATS = NullStats()
+
+
+class StatsWriter:
+    """Wrap an output file to count the bytes written and the time spent writing them."""
+
+    def __init__(self, out, stats):
+        self._out = out
+        self._stats = stats
+
+    def write(self, s):
+        with self._stats.phase('serialization'):
+            self._stats.count('output_bytes', len(s.encode('utf-8')))
+            return self._out.write(s)
+
+
+def write_svg(out, layout, keymap, *, scale, stats=None, **options):
+    stats = stats or NO_STATS
+    with stats.phase('layout'):
+        compiled = compile_layout(layout, scale)
+    write_compiled_svg(out, compiled, keymap, stats=stats, **options)
+
+
+def write_compiled_svg(out, compiled, keymap, *, label_table=False, layers=False, script=True, tooltips=False, compact=False, stats=None):
+    """Render a keymap on a compiled layout.
+
+    With layers, the labels of every declared column are pre-rendered and
+    switched with CSS classes; without script, the SVG has no scripts. With
+    tooltips, dead keys list what they compose and function keys show the
+    string they send when hovered. Compact output uses the layout's
+    compacted() form and a minified script.
+    """
+    stats = stats or NO_STATS
+    if stats is not NO_STATS:
+        out = StatsWriter(out, stats)
+    if compact:
+        compiled = compiled.compacted()
+    # Only the script reads the labels of other columns, from the table.
+    table = LabelTable(keymap.columns if label_table else None) if script else None
+    ctx = RenderContext(0, 0, scale=compiled.scale, keymap=keymap, out=out, label_table=table)
+    with stats.phase('labels'):
+        labels = compiled.labels(ctx)
+        titles = key_tooltips(keymap, compiled.keys) if tooltips else None
+    with stats.phase('render'):
+        if layers:
+            _write_layered_document(ctx, compiled, labels, script, titles=titles)
+        else:
+            _write_svg_document(ctx, compiled, labels, script, titles)
+
+
+def _write_svg_document(ctx, compiled, labels, script=True, titles=None):
+    ctx.out.write(svg_header(compiled, ctx.scale, script=SCRIPT if script else None))
+    compiled.render(ctx, labels, titles)
+    ctx.out.write(svg_footer(ctx.label_table, compact=compiled.compact))
+
+
+def svg_header(compiled, scale, *, script=SCRIPT, active='.active .bg', style='', root_class=None):
+    width, height = compiled.width, compiled.height
+    root = f' class="{root_class}"' if root_class else ''
+    stylesheet = f'''.mod{{cursor:pointer}}
+.mod .bg{{fill:#ddd}}
+{active}{{fill:#fd9}}
+.bg{{fill:#eee;stroke:#ccc;stroke-linejoin:round}}
+.lbl{{fill:#333;text-anchor:middle;text-align:center}}
+{style}'''
+    if compiled.compact:
+        script = f'<script><![CDATA[{minify_script(script)}]]></script>' if script is not None else ''
+        return (
+            f'<svg{root} width="{compact_number(width+3)}" height="{compact_number(height+3)}" viewBox="-1 -1 {compact_number(width+2)} {compact_number(height+2)}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'
+            f'<style>{stylesheet.replace(chr(10), "")}</style>{script}<defs>{compiled.defs}</defs>'
+            f'<g font-family="Arial" font-size="{scale // 4}px" font-size-adjust="0.518"><g>'
+        )
+    script = f'<script><![CDATA[\n{script}\n]]></script>\n' if script is not None else ''
+    return f'''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
+<svg{root} width="{width+3}" height="{height+3}" viewBox="-1 -1 {width+2} {height+2}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+<style>
+{stylesheet}</style>
+{script}<g font-family="Arial" font-size="{scale // 4}px" font-size-adjust="0.518"><g>'''
+
+
+def svg_footer(table=None, script=None, *, compact=False):
+    scripts = [table.script()] if table is not None else []
+    if script is not None:
+        scripts.append(script)
+    if compact:
+        return '</g></g>' + ''.join(f'<script><![CDATA[{minify_script(script)}]]></script>' for script in scripts) + '</svg>\n'
+    return '</g></g>\n' + ''.join(f'<script><![CDATA[\n{script}\n]]></script>\n' for script in scripts) + '</svg>\n'
+
+
+# A string or template literal of a script, or the whitespace around an
+# operator or a punctuator outside of them.
+_SCRIPT_TOKEN = r"""("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|`(?:[^`\\]|\\.)*`)|\s*([{}()\[\];,:=<>!&|?*/%+-])\s*"""
+
+
+@lru_cache(maxsize=None)
+def minify_script(script):
+    """Strip the comment lines and the whitespace of a script that are not needed to run it.
+
+    Whitespace is kept in literals and between words, so the scripts must
+    not rely on whitespace between operators such as a + +b.
+    """
+    lines = (line.strip() for line in script.split('\n'))
+    script = '\n'.join(line for line in lines if line and not line.startswith('//'))
+    return _regex(_SCRIPT_TOKEN).sub(lambda match: match.group(1) or match.group(2), script)
+
+
+def display_label(labels, column, caps):
+    """Return the label shown for a key in a column, as the script does."""
+    label = labels[column] if column < len(labels) else ''
+    if len(label) > 1 and label[0] == '+':
+        if caps:
+            label = labels[column ^ 1] if column ^ 1 < len(labels) else ''
+            if len(label) > 1 and label[0] == '+':
+                label = label[1:]
+        else:
+            label = label[1:]
+    return label
+
+
+MODIFIER_BITS = {
+    'SHIFT': 1,
+    'ALTGR': 2,
+    'CTRL': 4,
+    'ALT': 8,
+    'SHIFTL': 16,
+    'SHIFTR': 32,
+    'CTRLR': 64,
+    'CTRLL': 128,
+    'CAPSSHIFT': 256,
+}
+
+
+def key_modifier(label):
+    """Return 'caps' or the column bit toggled by clicking a key with this label, as mod() does in the script."""
+    if label == 'CAPS LOCK':
+        return 'caps'
+    if label.endswith(' LOCK'):
+        label = label[:-len(' LOCK')]
+    return MODIFIER_BITS.get(label)
+
+
+def _write_layered_document(ctx, compiled, labels, script=True, diff=None, titles=None):
+    """Write an SVG with the labels of every declared column pre-rendered as a layer.
+
+    The root element's classes select the layer: col-N for the column, caps
+    while caps lock is on and on-B for every modifier bit B of the column.
+    Identical layers are written once. With a keymap_diff(), the keys with
+    bindings that differ in the shown column are highlighted. titles are the
+    tooltips of the keys.
+    """
+    import json
+
+    declared = set(ctx.keymap.columns)
+    declared_labels = [
+        [label if column in declared else '' for column, label in enumerate(key_labels)]
+        for key_labels in labels
+    ]
+    layers = {}
+    for column in ctx.keymap.columns:
+        for caps in (False, True):
+            layer = tuple(display_label(key_labels, column, caps) for key_labels in declared_labels)
+            layers.setdefault(layer, {}).setdefault(column, []).append(caps)
+
+    selectors = []
+    for i, (layer, columns) in enumerate(layers.items()):
+        if not any(layer):
+            continue
+        for column, caps_states in columns.items():
+            if len(caps_states) == 2:
+                selectors.append(f'.col-{column} .L{i}')
+            elif caps_states[0]:
+                selectors.append(f'.col-{column}.caps .L{i}')
+            else:
+                selectors.append(f'.col-{column}:not(.caps) .L{i}')
+
+    keys = []
+    modifiers = set()
+    for key, key_labels in zip(compiled.keys, declared_labels):
+        classes = key_classes(main_label(labels[len(keys)]))
+        # Like the script, a modifier key without a label in the current
+        # column acts as in column 0.
+        base_label = key_labels[0] if key_labels and classes == 'key mod' else ''
+        modifier = key_modifier(base_label)
+        column_modifiers = {}
+        for column in ctx.keymap.columns:
+            column_modifier = key_modifier((key_labels[column] if column < len(key_labels) else '') or base_label)
+            if column_modifier != modifier:
+                column_modifiers[column] = '' if column_modifier is None else column_modifier
+        data = ''
+        if modifier is not None:
+            modifiers.add(modifier)
+            classes += f' mod-{modifier}'
+        if modifier is not None or column_modifiers:
+            data = f' data-mod="{"" if modifier is None else modifier}"'
+        if column_modifiers:
+            data += f' data-mods="{xml_escape(json.dumps(column_modifiers))}"'
+        title = [titles[len(keys)]] if titles is not None and titles[len(keys)] is not None else []
+        if diff is not None and key.keycode in diff:
+            bindings = diff[key.keycode]
+            classes += ''.join(f' {kind}-{column}' for column, kind, before, after in bindings)
+            title += [diff_line(key.keycode, binding) for binding in bindings]
+        title = '<title>' + xml_escape('\n'.join(title)) + '</title>' if title else ''
+        keys.append(f'<g class="{classes}"{data}>{title}{key.bg}</g>')
+    active = ','.join(
+        '.caps .mod-caps .bg' if modifier == 'caps' else f'.on-{modifier} .mod-{modifier} .bg'
+        for modifier in sorted(modifiers, key=str)
+    ) or '.active .bg'
+    style = '.layer{display:none}\n'
+    if selectors:
+        style += ','.join(selectors) + '{display:inline}\n'
+    if diff is not None:
+        for kind, color in DIFF_COLORS.items():
+            columns = sorted({column for bindings in diff.values() for column, binding_kind, before, after in bindings if binding_kind == kind})
+            if columns:
+                style += ','.join(f'.col-{column} .{kind}-{column} .bg' for column in columns) + f'{{fill:{color}}}\n'
+
+    out = ctx.out
+    out.write(svg_header(compiled, ctx.scale, script=LAYERS_SCRIPT if script else None, active=active, style=style, root_class='col-0'))
+    out.write(''.join(keys))
+    for i, layer in enumerate(layers):
+        if any(layer):
+            out.write(f'<g class="layer L{i}">' + ''.join(
+                f'<text class="lbl" x="{key.text_x}" y="{key.text_y}">{svg_label(key.text_x, label)}</text>'
+                for key, label in zip(compiled.keys, layer) if label
+            ) + '</g>')
+    out.write(svg_footer(compact=compiled.compact))
+
+
+def layout_data(layout_name, keymap, *, scale, keymap_name=None):
+    """Return the keys of a keymap on a layout as JSON-serializable data.
+
+    Every key has its keycode, its geometry and, for each declared column in
+    columns, its keysym and its label.
+    """
+    compiled = compile_layout(LAYOUTS[layout_name], scale)
+    columns = list(keymap.columns)
+    keys = []
+    for key in compiled.keys:
+        row = keymap.get(key.keycode, [])
+        keysyms = [row[column] if column < len(row) else 'VoidSymbol' for column in columns]
+        data = {
+            'keycode': key.keycode,
+            'shape': key.shape,
+            'x': key.x,
+            'y': key.y,
+            'width': key.width,
+            'height': key.height,
+        }
+        if key.points is not None:
+            data['points'] = [list(point) for point in key.points]
+        data['keysyms'] = keysyms
+        data['labels'] = [resolve_keysym(keysym).label for keysym in keysyms]
+        keys.append(data)
+    return {
+        'keymap': keymap_name,
+        'layout': layout_name,
+        'scale': scale,
+        'width': compiled.width,
+        'height': compiled.height,
+        'columns': columns,
+        'keys': keys,
+    }
+
+
+def write_json(out, layout_name, keymap, *, scale, keymap_name=None, stats=None):
+    """Write the layout_data() of a keymap as a single line of JSON."""
+    import json
+
+    stats = stats or NO_STATS
+    with stats.phase('labels'):
+        data = layout_data(layout_name, keymap, scale=scale, keymap_name=keymap_name)
+    with stats.phase('serialization'):
+        out.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def write_ndjson(out, keymap_filenames, layout_names, scales, *, include_path=INCLUDE_PATH, cache_dir=None, stats=None):
+    """Stream one line of JSON for every keymap, layout and scale combination.
+
+    A keymap that cannot be loaded gets a line with its error instead.
+    """
+    import json
+
+    for keymap_filename in keymap_filenames:
+        try:
+            keymap = load_keymap(keymap_filename, include_path=include_path, cache_dir=cache_dir, stats=stats)
+        except (OSError, ValueError) as e:
+            out.write(json.dumps({'keymap': keymap_filename, 'error': str(e)}, ensure_ascii=False) + '\n')
+            continue
+        for layout_name in layout_names:
+            for scale in scales:
+                write_json(out, layout_name, keymap, scale=scale, keymap_name=keymap_filename, stats=stats)
+
+
+def open_output(filename, output_format='svg'):
+    """Open filename, or the standard output for None, for writing text.
+
+    svgz output is gzip-compressed as it is written.
+    """
+    if output_format == 'svgz':
+        import gzip
+
+        return gzip.open(filename if filename is not None else sys.stdout.buffer, 'wt', encoding='utf-8')
+    return open(filename, 'w', encoding='utf-8') if filename is not None else nullcontext(sys.stdout)
+
+
+def render_job(job):
+    keymap_filename, include_path, cache_dir, layout_name, scale, output_filename, output_format, options, collect_stats = job
+    stats = Stats() if collect_stats else None
+    keymap = load_keymap(keymap_filename, include_path=include_path, cache_dir=cache_dir, stats=stats)
+    with open_output(output_filename, output_format) as f:
+        if output_format == 'json':
+            write_json(f, layout_name, keymap, scale=scale, keymap_name=keymap_filename, stats=stats)
+        else:
+            write_svg(f, LAYOUTS[layout_name], keymap, scale=scale, stats=stats, **options)
+    return stats.report() if stats is not None else None
+
+
+def render_batch(keymap_filenames, layout_names, scales, output_dir, *, include_path=INCLUDE_PATH, cache_dir=None, output_format='svg', jobs=None, stats=None, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    index = []
+    for keymap_filename in keymap_filenames:
+        name = os.path.basename(keymap_filename)
+        for layout_name in layout_names:
+            for scale in scales:
+                if len(scales) > 1:
+                    output_name = f'{name}-{layout_name}-{scale}.{output_format}'
+                    title = f'{name} ({layout_name.upper()}, {scale})'
+                else:
+                    output_name = f'{name}-{layout_name}.{output_format}'
+                    title = f'{name} ({layout_name.upper()})'
+                tasks.append((keymap_filename, include_path, cache_dir, layout_name, scale, os.path.join(output_dir, output_name), output_format, options, stats is not None))
+                index.append(f'<li><a href="{xml_escape(output_name)}">{xml_escape(title)}</a></li>\n')
+
+    if jobs == 1 or len(tasks) == 1:
+        reports = [render_job(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            reports = list(executor.map(render_job, tasks))
+    if stats is not None:
+        for report in reports:
+            stats.merge(report)
+
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('<ul>\n' + ''.join(index) + '</ul>\n')
+
+
+def check_keymap(filename, layout_name='ansi', *, include_path=INCLUDE_PATH):
+    """Lint a keymap and return its problems.
+
+    Every problem is a dict with a kind: 'syntax' and 'include' errors carry
+    the file, line and column they were found at, 'unknown-keysym' lists the
+    keycodes using a keysym without a label, 'unplaced-keycodes' the keycodes
+    with keysyms that are not on the layout and 'empty-keys' the keys of the
+    layout without keysyms.
+    """
+    errors = []
+    try:
+        keymap = load_keymap(filename, include_path=include_path, errors=errors)
+    except (OSError, ValueError) as e:
+        return [{'kind': 'error', 'message': str(e)}]
+    problems = [
+        {'kind': 'include' if isinstance(e, IncludeError) else 'syntax', 'file': e.filename, 'line': e.line, 'column': e.column, 'message': e.message}
+        for e in sorted(errors, key=lambda e: (e.filename or '', e.line or 0, e.column or 0))
+    ]
+
+    matrix = resolve_labels(keymap)
+    unknown = {}
+    for code in keymap:
+        for keysym in set(keymap.get(code)):
+            if keysym in matrix.unknown or keysym in matrix.errors:
+                unknown.setdefault(keysym, []).append(code)
+    for keysym, codes in sorted(unknown.items()):
+        message = matrix.errors.get(keysym, f'No label for keysym: {keysym}')
+        problems.append({'kind': 'unknown-keysym', 'keysym': keysym, 'keycodes': sorted(codes), 'message': message})
+
+    layout_codes = {key.keycode for key in compile_layout(LAYOUTS[layout_name], 60).keys}
+    unplaced = sorted(
+        code for code in keymap
+        if code not in layout_codes and any(keysym != 'VoidSymbol' for keysym in keymap.get(code))
+    )
+    if unplaced:
+        problems.append({'kind': 'unplaced-keycodes', 'keycodes': unplaced, 'message': f'{len(unplaced)} keycodes are not on the {layout_name} layout'})
+    empty = sorted(
+        code for code in layout_codes
+        if all(keysym == 'VoidSymbol' for keysym in keymap.get(code, []))
+    )
+    if empty:
+        problems.append({'kind': 'empty-keys', 'keycodes': empty, 'message': f'{len(empty)} keys of the {layout_name} layout have no keysyms'})
+    return problems
+
+
+def check_job(job):
+    filename, layout_name, include_path = job
+    return {'keymap': filename, 'problems': check_keymap(filename, layout_name, include_path=include_path)}
+
+
+KEYMAP_SUFFIXES = ('.map',) + tuple('.map' + suffix for suffix in DECOMPRESSORS)
+
+
+def check_tree(directory, layout_name='ansi', *, include_path=None, jobs=None):
+    """Lint every keymap under directory with a pool of worker processes and return a report.
+
+    Without an include path, includes are looked up in every directory named
+    include in the tree.
+    """
+    filenames = []
+    include_dirs = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        if os.path.basename(root) == 'include':
+            include_dirs.append(root)
+        filenames += [os.path.join(root, name) for name in sorted(files) if name.endswith(KEYMAP_SUFFIXES)]
+    if include_path is None:
+        include_path = include_dirs or INCLUDE_PATH
+
+    tasks = [(filename, layout_name, include_path) for filename in filenames]
+    if jobs == 1 or len(tasks) <= 1:
+        results = [check_job(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(tasks) // ((jobs or os.cpu_count() or 1) * 4))
+            results = list(executor.map(check_job, tasks, chunksize=chunksize))
+
+    counts = {}
+    for result in results:
+        for problem in result['problems']:
+            counts[problem['kind']] = counts.get(problem['kind'], 0) + 1
+    return {
+        'directory': directory,
+        'layout': layout_name,
+        'include_path': list(include_path),
+        'keymaps': len(results),
+        'problems': counts,
+        'results': results,
+    }
+
+
+def keymap_changes(old, new):
+    """Return {keycode: [column, ...]} for the keysyms that differ between two keymaps."""
+    changes = {}
+    for code in set(old) | set(new):
+        if code in old and code in new and old.entry(code) == new.entry(code):
+            continue
+        old_keysyms, new_keysyms = old.get(code, []), new.get(code, [])
+        width = max(len(old_keysyms), len(new_keysyms))
+        old_keysyms += [None] * (width - len(old_keysyms))
+        new_keysyms += [None] * (width - len(new_keysyms))
+        columns = [column for column in range(width) if old_keysyms[column] != new_keysyms[column]]
+        if columns:
+            changes[code] = columns
+    return changes
+
+
+# The modifiers whose bits make up a column, from the lowest bit.
+COLUMN_MODIFIERS = tuple(name for name in MODIFIERS if name != 'plain')
+
+
+@lru_cache(maxsize=None)
+def column_name(column):
+    """Return the modifiers of a column as written in keymaps, e.g. 'shift altgr', or 'plain' for column 0."""
+    return ' '.join(name for bit, name in enumerate(COLUMN_MODIFIERS) if column & (1 << bit)) or 'plain'
+
+
+def keymap_diff(old, new):
+    """Compare two keymaps binding by binding.
+
+    Return {keycode: [(column, kind, old keysym, new keysym), ...]} for the
+    declared columns whose keysyms differ, where kind is 'added', 'removed'
+    or 'changed'. A column that a keymap does not declare has no binding in
+    it. Keycodes with identical entries are skipped without expanding their
+    keysyms.
+    """
+    old_columns, new_columns = set(old.columns), set(new.columns)
+    diff = {}
+    for code, columns in keymap_changes(old, new).items():
+        old_keysyms, new_keysyms = old.get(code, []), new.get(code, [])
+        bindings = []
+        for column in columns:
+            before = old_keysyms[column] if column in old_columns and column < len(old_keysyms) else 'VoidSymbol'
+            after = new_keysyms[column] if column in new_columns and column < len(new_keysyms) else 'VoidSymbol'
+            if before == after:
+                continue
+            kind = 'added' if before == 'VoidSymbol' else 'removed' if after == 'VoidSymbol' else 'changed'
+            bindings.append((column, kind, before, after))
+        if bindings:
+            diff[code] = bindings
+    return diff
+
+
+DIFF_COLORS = {'added': '#bfb', 'removed': '#fbb', 'changed': '#fe9'}
+
+
+def diff_line(code, binding):
+    column, kind, before, after = binding
+    if kind == 'added':
+        change = f'added {after}'
+    elif kind == 'removed':
+        change = f'removed {before}'
+    else:
+        change = f'{before} -> {after}'
+    return f'keycode {code} {column_name(column)}: {change}'
+
+
+def diff_summary(old_name, new_name, diff):
+    """Return a text summary of a keymap_diff(): a count of the changes, then one line per binding."""
+    counts = {kind: 0 for kind in DIFF_COLORS}
+    lines = []
+    for code in sorted(diff):
+        for binding in diff[code]:
+            counts[binding[1]] += 1
+            lines.append('  ' + diff_line(code, binding) + '\n')
+    total = sum(counts.values())
+    details = ', '.join(f'{n} {kind}' for kind, n in counts.items())
+    return f'{old_name} -> {new_name}: {len(diff)} keycodes, {total} bindings differ ({details})\n' + ''.join(lines)
+
+
+def write_diff_svg(out, layout, old, new, *, scale, diff=None, script=True, tooltips=False, compact=False, stats=None):
+    """Render the new keymap with the layers of write_compiled_svg() and highlight the bindings that differ from the old one.
+
+    Added, removed and changed bindings are colored in the column they are
+    in, and every highlighted key has a title listing its changes.
+    """
+    stats = stats or NO_STATS
+    if stats is not NO_STATS:
+        out = StatsWriter(out, stats)
+    with stats.phase('layout'):
+        compiled = compile_layout(layout, scale)
+        if compact:
+            compiled = compiled.compacted()
+    with stats.phase('diff'):
+        if diff is None:
+            diff = keymap_diff(old, new)
+    ctx = RenderContext(0, 0, scale=scale, keymap=new, out=out)
+    with stats.phase('labels'):
+        labels = compiled.labels(ctx)
+        titles = key_tooltips(new, compiled.keys) if tooltips else None
+    with stats.phase('render'):
+        _write_layered_document(ctx, compiled, labels, script, diff, titles)
+
+
+def diff_job(job):
+    old_filename, new_filename, include_path, cache_dir, layout_name, scale, output_filename, script, tooltips, compact = job
+    old = load_keymap(old_filename, include_path=include_path, cache_dir=cache_dir)
+    new = load_keymap(new_filename, include_path=include_path, cache_dir=cache_dir)
+    diff = keymap_diff(old, new)
+    if output_filename is not None:
+        with open(output_filename, 'w', encoding='utf-8') as f:
+            write_diff_svg(f, LAYOUTS[layout_name], old, new, scale=scale, diff=diff, script=script, tooltips=tooltips, compact=compact)
+    return diff_summary(old_filename, new_filename, diff)
+
+
+def diff_batch(pairs, layout_name, scale, output_dir, *, include_path=INCLUDE_PATH, cache_dir=None, jobs=None, script=True, tooltips=False, compact=False):
+    """Diff (old, new) keymap pairs with a pool of worker processes.
+
+    Every diff is rendered into output_dir, which gets an index.html, and the
+    summaries are returned in the order of the pairs. Pairs sharing keymaps in
+    the same worker parse them once.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    index = []
+    for old_filename, new_filename in pairs:
+        old_name, new_name = os.path.basename(old_filename), os.path.basename(new_filename)
+        output_name = f'{old_name}--{new_name}-{layout_name}.svg'
+        title = f'{old_name} -> {new_name} ({layout_name.upper()})'
+        tasks.append((old_filename, new_filename, include_path, cache_dir, layout_name, scale, os.path.join(output_dir, output_name), script, tooltips, compact))
+        index.append(f'<li><a href="{xml_escape(output_name)}">{xml_escape(title)}</a></li>\n')
+
+    if jobs == 1 or len(tasks) <= 1:
+        summaries = [diff_job(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(tasks) // ((jobs or os.cpu_count() or 1) * 4))
+            summaries = list(executor.map(diff_job, tasks, chunksize=chunksize))
+
+    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('<ul>\n' + ''.join(index) + '</ul>\n')
+    return summaries
+
+
+def stroke_cost(column):
+    """Return the cost of a keystroke in a column: the key and every modifier held for it."""
+    return 1 + bin(column).count('1')
+
+
+class TypingIndex:
+    """The cheapest ways to type every character of a keymap.
+
+    A route is a tuple of (keycode, column) keystrokes: a key that types the
+    character, or a dead key followed by a key that it composes with. Only the
+    routes with the lowest total cost are kept, ties in keycode order, so a
+    lookup is a single dict access.
+    """
+
+    def __init__(self, keymap):
+        self._routes = {}
+        self._costs = {}
+        dead_routes = {}
+        dead_costs = {}
+        for code in sorted(keymap):
+            keysyms = keymap.keysyms(code)
+            for column in keymap.columns:
+                if column >= len(keysyms):
+                    break
+                keysym = keysyms[column]
+                character = keysym_character(keysym)
+                if character is not None:
+                    self._add(self._routes, self._costs, character, ((code, column),), stroke_cost(column))
+                    continue
+                accent = DEAD_KEYS.get(keysym_synonyms.get(keysym, keysym))
+                if accent is not None:
+                    self._add(dead_routes, dead_costs, accent, ((code, column),), stroke_cost(column))
+
+        direct = {character: (routes, self._costs[character]) for character, routes in self._routes.items()}
+        for accent, routes in dead_routes.items():
+            for second, result in keymap.compose.completions(accent).items():
+                # Results that type no character are stored as their labels.
+                if second not in direct or len(result) != 1:
+                    continue
+                second_routes, second_cost = direct[second]
+                for route in routes:
+                    for second_route in second_routes:
+                        self._add(self._routes, self._costs, result, route + second_route, dead_costs[accent] + second_cost)
+
+    @staticmethod
+    def _add(routes, costs, character, route, cost):
+        best = costs.get(character)
+        if best is None or cost < best:
+            costs[character] = cost
+            routes[character] = [route]
+        elif cost == best:
+            routes[character].append(route)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __contains__(self, character):
+        return character in self._routes
+
+    def __iter__(self):
+        return iter(self._routes)
+
+    def routes(self, character):
+        """Return the cheapest routes that type character, or an empty tuple."""
+        return tuple(self._routes.get(character, ()))
+
+    def cost(self, character):
+        """Return the cost of the cheapest routes that type character, or None."""
+        return self._costs.get(character)
+
+
+def stroke_text(keymap, stroke):
+    """Describe a (keycode, column) keystroke, e.g. "keycode 38 altgr (l)"."""
+    code, column = stroke
+    key = main_label([resolve_keysym(keymap.keysym(code, 0)).label])
+    return f'keycode {code} {column_name(column)} ({key})'
+
+
+def how_to_type(keymap, text):
+    """Return the lines explaining how to type every distinct character of text with a keymap."""
+    index = keymap.typing_index()
+    lines = []
+    for character in dict.fromkeys(text):
+        routes = index.routes(character)
+        if not routes:
+            lines.append(f'{character} (U+{ord(character):04X}): cannot be typed\n')
+            continue
+        ways = ' or '.join(', then '.join(stroke_text(keymap, stroke) for stroke in route) for route in routes)
+        lines.append(f'{character} (U+{ord(character):04X}): {ways}\n')
+    return ''.join(lines)
+
+
+HEATMAP_CHUNK_SIZE = 1 << 20
+
+
+def count_characters(chunks, characters):
+    """Count how often each of characters occurs in a stream of text chunks.
+
+    Return the counts in the order of characters, followed by the count of
+    all other characters. Strings of characters that are not a single
+    character count 0. With numpy, every chunk is counted with bincount()
+    over a codepoint lookup table; without it, with a Counter.
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    other = len(characters)
+    if numpy is not None:
+        indexes = [i for i, character in enumerate(characters) if len(character) == 1]
+        codepoints = [ord(characters[i]) for i in indexes]
+        limit = max(codepoints, default=0) + 1
+        table = numpy.full(limit + 1, other, dtype=numpy.intp)
+        table[codepoints] = indexes
+        totals = numpy.zeros(other + 1, dtype=numpy.int64)
+        for chunk in chunks:
+            codepoints = numpy.frombuffer(chunk.encode('utf-32-le', 'surrogatepass'), dtype=numpy.uint32)
+            totals += numpy.bincount(table[numpy.minimum(codepoints, limit)], minlength=other + 1)
+        return totals.tolist()
+    counter = Counter()
+    for chunk in chunks:
+        counter.update(chunk)
+    counts = [counter.pop(character, 0) for character in characters]
+    counts.append(sum(counter.values()))
+    return counts
+
+
+def modifier_keycodes(keymap):
+    """Return {column bit: keycode} for the first key bound to every modifier in column 0."""
+    keycodes = {}
+    for code in sorted(keymap):
+        modifier = key_modifier(main_label([resolve_keysym(keymap.keysym(code, 0)).label]))
+        if isinstance(modifier, int):
+            keycodes.setdefault(modifier, code)
+    return keycodes
+
+
+def key_usage(keymap, chunks):
+    """Count the key presses needed to type a stream of text chunks with a keymap.
+
+    Every character is typed with its cheapest route of the keymap's
+    TypingIndex, holding the first key of every modifier of its columns.
+    Return ({keycode: presses}, the number of characters that cannot be typed).
+    """
+    index = keymap.typing_index()
+    characters = list(index)
+    counts = count_characters(chunks, characters)
+    modifiers = modifier_keycodes(keymap)
+    usage = Counter()
+    for character, count in zip(characters, counts):
+        if not count:
+            continue
+        for code, column in index.routes(character)[0]:
+            usage[code] += count
+            for bit, modifier_code in modifiers.items():
+                if column & bit:
+                    usage[modifier_code] += count
+    return usage, counts[-1]
+
+
+# The fills of the heat levels, from unused keys to the most used one.
+HEAT_COLORS = ('#eee', '#ffc', '#ffeda0', '#fed976', '#feb24c', '#fd8d3c', '#fc4e2a', '#e31a1c', '#bd0026', '#800026')
+
+
+def write_heatmap_svg(out, layout, keymap, usage, *, scale, compact=False, stats=None):
+    """Render a keymap with its keys colored by the presses in a key_usage() count.
+
+    Every key has a title with its presses and their share of all presses.
+    """
+    stats = stats or NO_STATS
+    if stats is not NO_STATS:
+        out = StatsWriter(out, stats)
+    with stats.phase('layout'):
+        compiled = compile_layout(layout, scale)
+        if compact:
+            compiled = compiled.compacted()
+    ctx = RenderContext(0, 0, scale=scale, keymap=keymap, out=out)
+    with stats.phase('labels'):
+        labels = compiled.labels(ctx)
+    with stats.phase('render'):
+        total = sum(usage.values())
+        most = max(usage.values(), default=0)
+        levels = len(HEAT_COLORS) - 1
+        style = ''.join(f'.heat-{level} .bg{{fill:{color}}}\n' for level, color in enumerate(HEAT_COLORS) if level)
+        style += ','.join(f'.heat-{level} .lbl' for level in range(levels - 1, levels + 1)) + '{fill:#fff}\n'
+        out.write(svg_header(compiled, scale, script=None, style=style))
+        for key, key_labels in zip(compiled.keys, labels):
+            label = main_label(key_labels)
+            presses = usage.get(key.keycode, 0)
+            level = -(-levels * presses // most) if presses else 0
+            share = 100 * presses / total if total else 0
+            out.write(
+                f'<g class="{key_classes(label)} heat-{level}"><title>keycode {key.keycode}: {presses} presses ({share:.2f}%)</title>' +
+                    key.bg +
+                    f'<text class="lbl" x="{key.text_x}" y="{key.text_y}">{svg_label(key.text_x, label)}</text></g>'
+            )
+        out.write(svg_footer(compact=compiled.compact))
+
+
+class IncrementalSvg:
+    """An SVG document of a keymap kept as one fragment per key.
+
+    update() renders again only the keys whose keycodes changed; the compiled
+    layout and the fragments of the other keys are kept.
+    """
+
+    def __init__(self, layout, keymap, *, scale, label_table=False):
+        self.compiled = compile_layout(layout, scale)
+        self.scale = scale
+        self.label_table = label_table
+        self._keys_by_code = {}
+        for k, key in enumerate(self.compiled.keys):
+            self._keys_by_code.setdefault(key.keycode, []).append(k)
+        self._render(keymap)
+
+    def _render(self, keymap):
+        self.keymap = keymap
+        self.table = LabelTable(keymap.columns if self.label_table else None)
+        labels = self.compiled.labels(RenderContext(0, 0, scale=self.scale, keymap=keymap))
+        for key_labels in labels:
+            self.table.add(key_labels)
+        self.fragments = [key_fragment(key, key_labels) for key, key_labels in zip(self.compiled.keys, labels)]
+
+    def update(self, keymap, changes=None):
+        """Switch to a new version of the keymap and return {key index: fragment} for the keys rendered again."""
+        if changes is None:
+            changes = keymap_changes(self.keymap, keymap)
+        if self.label_table and list(keymap.columns) != list(self.keymap.columns):
+            # The table only holds the declared columns.
+            self._render(keymap)
+            return dict(enumerate(self.fragments))
+        ks = sorted(k for code in changes for k in self._keys_by_code.get(code, ()))
+        matrix = resolve_labels(keymap, {self.compiled.keys[k].keycode for k in ks})
+        patches = {}
+        for k in ks:
+            key = self.compiled.keys[k]
+            labels = matrix.labels[key.keycode]
+            self.table.set(k, labels)
+            patches[k] = self.fragments[k] = key_fragment(key, labels)
+        self.keymap = keymap
+        return patches
+
+    def write(self, out, script=None):
+        out.write(svg_header(self.compiled, self.scale))
+        out.write(''.join(self.fragments))
+        out.write(svg_footer(self.table, script))
+
+
+class LiveServer:
+    """Serve a document on localhost and push updates to the open pages as server-sent events.
+
+    GET / returns the current document and GET /events streams the events
+    published after the page was loaded.
+    """
+
+    def __init__(self, port, host='127.0.0.1'):
+        import queue
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.document = b''
+        self._clients = set()
+        self._lock = threading.Lock()
+        live = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/':
+                    with live._lock:
+                        document = live.document
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/svg+xml; charset=utf-8')
+                    self.send_header('Content-Length', str(len(document)))
+                    self.send_header('Cache-Control', 'no-store')
+                    self.end_headers()
+                    self.wfile.write(document)
+                elif self.path == '/events':
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-store')
+                    self.end_headers()
+                    events = queue.Queue()
+                    with live._lock:
+                        live._clients.add(events)
+                    try:
+                        while True:
+                            try:
+                                event = events.get(timeout=15)
+                            except queue.Empty:
+                                event = b': keepalive\n\n'
+                            self.wfile.write(event)
+                            self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    finally:
+                        with live._lock:
+                            live._clients.discard(events)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f'http://{host}:{self._server.server_address[1]}/'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def publish(self, document, event=None):
+        import json
+
+        data = None if event is None else ('data: ' + json.dumps(event, ensure_ascii=False) + '\n\n').encode('utf-8')
+        with self._lock:
+            self.document = document.encode('utf-8')
+            clients = list(self._clients)
+        if data is not None:
+            for events in clients:
+                events.put(data)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _file_mode(filename):
+    """Return the permissions of an existing file, or those that open() would give a new one."""
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _write_file_atomically(filename, write):
+    import io
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            write(f)
+        # Temporary files are only readable by their owner.
+        os.chmod(tmp, _file_mode(filename))
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def watch(keymap_filename, layout, output_filename, *, scale, include_path=INCLUDE_PATH, label_table=False, interval=0.1, port=None):
+    """Render a keymap to output_filename and render it again whenever it or one of its includes changes.
+
+    Only the changed files are parsed again and only the keys whose keycodes
+    changed are rendered again. With a port, the SVG is also served on
+    localhost and the open pages are patched as the keymap changes.
+    """
+    import io
+
+    keymap = load_keymap(keymap_filename, include_path=include_path)
+    svg = IncrementalSvg(layout, keymap, scale=scale, label_table=label_table)
+    server = LiveServer(port) if port is not None else None
+
+    def publish(patches):
+        _write_file_atomically(output_filename, svg.write)
+        if server is not None:
+            document = io.StringIO()
+            svg.write(document, LIVE_SCRIPT)
+            event = {'keys': patches, 'table': svg.table.data()} if patches else None
+            server.publish(document.getvalue(), event)
+
+    def stamps(files):
+        try:
+            return {filename: _file_stamp(filename) for filename in files}
+        except OSError:
+            # A file is being replaced; look again on the next round.
+            return None
+
+    publish(None)
+    watched = stamps(keymap.files)
+    print(f'Watching {len(keymap.files)} files, writing {output_filename}', file=sys.stderr)
+    if server is not None:
+        print(f'Serving on {server.url}', file=sys.stderr)
+    try:
+        while True:
+            time.sleep(interval)
+            current = stamps(svg.keymap.files)
+            if current is None or current == watched:
+                continue
+            watched = current
+            start = time.perf_counter()
+            try:
+                keymap = load_keymap(keymap_filename, include_path=include_path)
+            except (OSError, ValueError) as e:
+                print(e, file=sys.stderr)
+                continue
+            changes = keymap_changes(svg.keymap, keymap)
+            patches = svg.update(keymap, changes)
+            publish(patches)
+            watched = stamps(keymap.files) or watched
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'{len(changes)} keycodes changed, {len(patches)} keys rendered again in {elapsed:.1f} ms', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.close()
+
+
+class LRUCache:
+    """A thread-safe LRU cache limited by the total size of its values in bytes."""
+
+    def __init__(self, max_bytes, sizeof=len):
+        from collections import OrderedDict
+        import threading
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._sizeof = sizeof
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.nbytes -= evicted_size
+
+
+class RenderService:
+    """Render keymaps on request for the --server mode.
+
+    Keymaps are looked up by name in keymap_dirs. Parsed keymaps, compiled
+    layouts and rendered SVGs are kept in LRU caches limited in bytes; the
+    SVGs are keyed by the content hash of the keymap and its includes, which
+    is also their ETag.
+    """
+
+    MIN_SCALE = 8
+    MAX_SCALE = 480
+
+    def __init__(self, keymap_dirs, *, include_path=INCLUDE_PATH,
+                 keymap_cache_bytes=64 << 20, layout_cache_bytes=16 << 20, svg_cache_bytes=64 << 20, **options):
+        import threading
+
+        self.keymap_dirs = [os.path.realpath(directory) for directory in keymap_dirs]
+        self.include_path = include_path
+        self.options = options
+        self.keymaps = LRUCache(keymap_cache_bytes, sizeof=lambda item: item[2].nbytes())
+        self.layouts = LRUCache(layout_cache_bytes, sizeof=lambda compiled: compiled.nbytes())
+        self.svgs = LRUCache(svg_cache_bytes)
+        # Parsing interns keysyms into module-level tables.
+        self._parse_lock = threading.Lock()
+
+    def find_keymap(self, name):
+        """Return the real path of a keymap, a .map file or a compressed one directly in one of keymap_dirs."""
+        suffixes = tuple('.map' + suffix for suffix in ['', *DECOMPRESSORS])
+        for directory in self.keymap_dirs:
+            for candidate in [name] + [name + suffix for suffix in suffixes]:
+                path = os.path.realpath(os.path.join(directory, candidate))
+                if path.endswith(suffixes) and os.path.dirname(path) == directory and os.path.isfile(path):
+                    return path
+        raise LookupError(f'Unknown keymap: {name}')
+
+    def keymap(self, path):
+        """Return the keymap at path and the content hash of it and its includes."""
+        cached = self.keymaps.get(path)
+        if cached is not None:
+            stamps, digest, keymap = cached
+            try:
+                if all(_file_stamp(filename) == stamp for filename, stamp in stamps):
+                    return digest, keymap
+            except OSError:
+                pass
+        import hashlib
+
+        with self._parse_lock:
+            keymap = load_keymap(path, include_path=self.include_path)
+            stamps = tuple((filename, _file_stamp(filename)) for filename in keymap.files)
+            digest = hashlib.sha256('\0'.join(f'{filename}\0{_content_hash(filename)}' for filename in keymap.files).encode('utf-8')).hexdigest()
+        self.keymaps.put(path, (stamps, digest, keymap))
+        return digest, keymap
+
+    def layout(self, layout_name, scale):
+        compiled = self.layouts.get((layout_name, scale))
+        if compiled is None:
+            compiled = CompiledLayout(LAYOUTS[layout_name], RenderContext(0, 0, scale=scale))
+            self.layouts.put((layout_name, scale), compiled)
+        return compiled
+
+    def render(self, keymap_name, layout_name='ansi', scale=60):
+        """Return the ETag and the SVG of a keymap, rendering it only if it is not cached."""
+        import io
+
+        if layout_name not in LAYOUTS:
+            raise ValueError(f'Unknown layout: {layout_name}')
+        if not self.MIN_SCALE <= scale <= self.MAX_SCALE:
+            raise ValueError(f'The scale must be between {self.MIN_SCALE} and {self.MAX_SCALE}')
+        digest, keymap = self.keymap(self.find_keymap(keymap_name))
+        options = ''.join(f'-{name}' for name, value in sorted(self.options.items()) if value)
+        etag = f'"{digest[:32]}-{layout_name}-{scale}{options}"'
+        svg = self.svgs.get(etag)
+        if svg is None:
+            out = io.StringIO()
+            write_compiled_svg(out, self.layout(layout_name, scale), keymap, **self.options)
+            svg = out.getvalue().encode('utf-8')
+            self.svgs.put(etag, svg)
+        return etag, svg
+
+
+def etag_matches(etag, if_none_match):
+    """Return whether an If-None-Match header lists etag, or is *.
+
+    The header is a comma-separated list of ETags, compared weakly as
+    RFC 9110 asks for If-None-Match: a W/ prefix is ignored.
+    """
+    if if_none_match is None:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+
+def make_server(service, port, host='127.0.0.1'):
+    """Return an HTTP server that answers GET /render?keymap=NAME&layout=LAYOUT&scale=SCALE with the SVGs of service."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path != '/render':
+                self.send_error(404)
+                return
+            query = parse_qs(url.query)
+            try:
+                keymap_name = query['keymap'][-1]
+                layout_name = query.get('layout', ['ansi'])[-1]
+                scale = int(query.get('scale', ['60'])[-1])
+                etag, svg = service.render(keymap_name, layout_name, scale)
+            except KeyError:
+                self.send_error(400, 'Missing parameter: keymap')
+                return
+            except LookupError as e:
+                self.send_error(404, str(e))
+                return
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            if etag_matches(etag, self.headers.get('If-None-Match')):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/svg+xml; charset=utf-8')
+            self.send_header('Content-Length', str(len(svg)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(svg)
+
+        def log_message(self, format, *args):
+            print(f'{self.address_string()} - {format % args}', file=sys.stderr)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(service, port, host='127.0.0.1'):
+    """Serve the SVGs of service on port until interrupted."""
+    server = make_server(service, port, host)
+    print(f'Serving on http://{host}:{server.server_address[1]}/render', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _help_formatter(prog):
+    """Return an argparse help formatter as wide as the terminal, like the default one, without importing shutil."""
+    import argparse
+
+    try:
+        columns = int(os.environ.get('COLUMNS', 0))
+    except ValueError:
+        columns = 0
+    if columns <= 0:
+        try:
+            columns = os.get_terminal_size(sys.__stdout__.fileno()).columns
+        except (AttributeError, ValueError, OSError):
+            columns = 0
+    return argparse.HelpFormatter(prog, width=(columns or 80) - 2)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Render a keyboard layout to SVG.', formatter_class=_help_formatter)
+    parser.add_argument('--iso', action='store_true', help='Render an ISO layout (same as --layout iso).')
+    parser.add_argument('--layout', action='append', choices=sorted(LAYOUTS), help='The layout to render. May be repeated with --output-dir.')
+    parser.add_argument('--scale', type=int, action='append', help='The scale of the rendered layout (default: 60). May be repeated with --output-dir.')
+    parser.add_argument('-o', '--output', help='Write the SVG to this file instead of the standard output.')
+    parser.add_argument('--output-dir', help='Render every keymap, layout and scale combination into this directory and write an index.html.')
+    parser.add_argument('--label-table', action='store_true', help='Restrict the label table read by the script to the declared columns.')
+    parser.add_argument('--format', choices=['svg', 'svgz', 'json', 'ndjson'], default='svg', help='The output format: an SVG, a gzip-compressed SVG, the keys with their geometry, keysyms and labels as JSON, or a stream of such JSON lines for every keymap, layout and scale (default: svg).')
+    parser.add_argument('--layers', action='store_true', help='Pre-render the labels of every declared column as a layer switched with CSS classes.')
+    parser.add_argument('--tooltips', action='store_true', help='Show what dead keys compose and what function keys send when they are hovered.')
+    parser.add_argument('--compact', action='store_true', help='Write smaller SVGs: rounded coordinates, shared key shapes, a minified script and no DOCTYPE.')
+    parser.add_argument('--no-script', dest='script', action='store_false', help='Do not include any script in the SVG.')
+    parser.add_argument('--stats', '--profile', action='store_true', help='Report the wall time of every phase and some counters as JSON on stderr.')
+    parser.add_argument('-I', '--include-dir', action='append', help='A directory to search for included keymaps (default: keymaps). May be repeated.')
+    parser.add_argument('--cache-dir', default=os.environ.get('KBD_LAYOUT_CACHE_DIR'), help='Keep parsed keymaps in this directory to skip parsing unchanged keymaps in later runs (default: $KBD_LAYOUT_CACHE_DIR).')
+    parser.add_argument('--watch', action='store_true', help='Render the keymap to --output again whenever it or one of its includes changes.')
+    parser.add_argument('--serve', type=int, metavar='PORT', help='With --watch, serve the SVG on localhost:PORT and update open pages live.')
+    parser.add_argument('--server', type=int, metavar='PORT', help='Serve GET /render?keymap=NAME&layout=LAYOUT&scale=SCALE on localhost:PORT, looking keymaps up in the given directories (default: the include directories).')
+    parser.add_argument('--diff', nargs=2, action='append', metavar=('OLD', 'NEW'), help='Render NEW with the bindings that differ from OLD highlighted per column and print a summary of the differences. May be repeated with --output-dir.')
+    parser.add_argument('--how-to-type', metavar='TEXT', help='Print the cheapest keystrokes that type every character of TEXT with every given keymap, including dead key sequences, instead of rendering.')
+    parser.add_argument('--heatmap', metavar='CORPUS', help='Render the keys colored by how often they are pressed to type the text in CORPUS (- for the standard input) with the keymap.')
+    parser.add_argument('--check', metavar='DIR', help='Lint every keymap under DIR against the layout instead of rendering, and print a JSON report.')
+    parser.add_argument('-j', '--jobs', type=int, help='The number of worker processes to use with --output-dir, --diff or --check (default: the number of CPUs).')
+    parser.add_argument('keymap', nargs='*', help='The keymap file to use. Several keymaps can be given with --output-dir; with --server, the directories to look keymaps up in.')
+    args = parser.parse_args()
+    stats = Stats() if args.stats else None
+    if stats is not None:
+        stats.phases['startup'] = time.perf_counter() - _START
+
+    layout_names = args.layout or []
+    if args.iso and 'iso' not in layout_names:
+        layout_names.append('iso')
+    if not layout_names:
+        layout_names = ['ansi']
+    scales = args.scale or [60]
+    include_path = args.include_dir or INCLUDE_PATH
+    options = {'label_table': args.label_table, 'layers': args.layers, 'script': args.script, 'tooltips': args.tooltips, 'compact': args.compact}
+    if args.layers and args.label_table:
+        parser.error('--layers and --label-table cannot be combined')
+
+    if args.check is not None:
+        if len(layout_names) > 1:
+            parser.error('--check checks a single layout')
+        import json
+
+        report = check_tree(args.check, layout_names[0], include_path=args.include_dir, jobs=args.jobs)
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        if report['problems'].get('syntax') or report['problems'].get('include') or report['problems'].get('error'):
+            sys.exit(1)
+    elif args.server is not None:
+        service = RenderService(args.keymap or include_path, include_path=include_path, **options)
+        serve(service, args.server)
+    elif args.diff is not None:
+        if args.keymap or len(layout_names) > 1 or len(scales) > 1:
+            parser.error('--diff renders a single layout and scale and takes no other keymaps')
+        if args.output_dir is not None:
+            summaries = diff_batch(args.diff, layout_names[0], scales[0], args.output_dir, include_path=include_path, cache_dir=args.cache_dir, jobs=args.jobs, script=args.script, tooltips=args.tooltips, compact=args.compact)
+            sys.stdout.write(''.join(summaries))
+        else:
+            if len(args.diff) > 1:
+                parser.error('several --diff pairs can only be rendered with --output-dir')
+            old_filename, new_filename = args.diff[0]
+            old = load_keymap(old_filename, include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+            new = load_keymap(new_filename, include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+            with (stats or NO_STATS).phase('diff'):
+                diff = keymap_diff(old, new)
+            with open(args.output, 'w', encoding='utf-8') if args.output is not None else nullcontext(sys.stdout) as out:
+                write_diff_svg(out, LAYOUTS[layout_names[0]], old, new, scale=scales[0], diff=diff, script=args.script, tooltips=args.tooltips, compact=args.compact, stats=stats)
+                out.flush()
+            # The summary goes to the standard error when the SVG is written to the standard output.
+            summary_out = sys.stdout if args.output is not None else sys.stderr
+            summary_out.write(diff_summary(old_filename, new_filename, diff))
+    elif not args.keymap:
+        parser.error('the following arguments are required: keymap')
+    elif args.how_to_type is not None:
+        for keymap_filename in args.keymap:
+            keymap = load_keymap(keymap_filename, include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+            with (stats or NO_STATS).phase('how-to-type'):
+                lines = how_to_type(keymap, args.how_to_type)
+            sys.stdout.write(f'{keymap_filename}:\n' if len(args.keymap) > 1 else '')
+            sys.stdout.write(''.join('  ' + line for line in lines.splitlines(True)) if len(args.keymap) > 1 else lines)
+    elif args.heatmap is not None:
+        if len(args.keymap) > 1 or len(layout_names) > 1 or len(scales) > 1:
+            parser.error('--heatmap renders a single keymap, layout and scale')
+        keymap = load_keymap(args.keymap[0], include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+        corpus = sys.stdin.fileno() if args.heatmap == '-' else args.heatmap
+        with open(corpus, encoding='utf-8', errors='replace', closefd=args.heatmap != '-') as f:
+            with (stats or NO_STATS).phase('count'):
+                usage, untyped = key_usage(keymap, iter(lambda: f.read(HEATMAP_CHUNK_SIZE), ''))
+        with open(args.output, 'w', encoding='utf-8') if args.output is not None else nullcontext(sys.stdout) as out:
+            write_heatmap_svg(out, LAYOUTS[layout_names[0]], keymap, usage, scale=scales[0], compact=args.compact, stats=stats)
+            out.flush()
+        if untyped:
+            print(f'{untyped} characters cannot be typed with {args.keymap[0]}', file=sys.stderr)
+    elif args.watch or args.serve is not None:
+        if not args.watch or args.output is None or args.output_dir is not None:
+            parser.error('--serve needs --watch, and --watch needs --output')
+        if len(args.keymap) > 1 or len(layout_names) > 1 or len(scales) > 1:
+            parser.error('only a single keymap, layout and scale can be watched')
+        if args.layers or not args.script or args.tooltips or args.compact:
+            parser.error('--watch cannot be combined with --layers, --no-script, --tooltips or --compact')
+        watch(args.keymap[0], LAYOUTS[layout_names[0]], args.output, scale=scales[0], include_path=include_path, port=args.serve, label_table=args.label_table)
+    elif args.format == 'ndjson':
+        if args.output_dir is not None:
+            parser.error('--format ndjson writes a single stream, use --output instead of --output-dir')
+        with open(args.output, 'w', encoding='utf-8') if args.output is not None else nullcontext(sys.stdout) as out:
+            write_ndjson(out, args.keymap, layout_names, scales, include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+            out.flush()
+    elif args.output_dir is not None:
+        render_batch(args.keymap, layout_names, scales, args.output_dir, include_path=include_path, cache_dir=args.cache_dir, output_format=args.format, jobs=args.jobs, stats=stats, **options)
+    else:
+        if len(args.keymap) > 1 or len(layout_names) > 1 or len(scales) > 1:
+            parser.error('several keymaps, layouts or scales can only be rendered with --output-dir or --format ndjson')
+        keymap = load_keymap(args.keymap[0], include_path=include_path, cache_dir=args.cache_dir, stats=stats)
+        with open_output(args.output, args.format) as out:
+            if args.format == 'json':
+                write_json(out, layout_names[0], keymap, scale=scales[0], keymap_name=args.keymap[0], stats=stats)
+            else:
+                write_svg(out, LAYOUTS[layout_names[0]], keymap, scale=scales[0], stats=stats, **options)
+            out.flush()
+
+    if stats is not None:
+        import json
+
+        report = stats.report()
+        report['total'] = round(time.perf_counter() - _START, 6)
+        print(json.dumps(report, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
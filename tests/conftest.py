@@ -0,0 +1,23 @@
+import glob
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEYMAP_DIR = os.path.join(ROOT, 'keymaps')
+BUNDLED_KEYMAPS = sorted(glob.glob(os.path.join(KEYMAP_DIR, '*.map')))
+
+sys.path.insert(0, ROOT)
+import kbd_layout  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    kbd_layout.clear_caches()
+
+
+def write_keymap(tmp_path, text, name='test.map'):
+    path = tmp_path / name
+    path.write_text(text, encoding='latin1')
+    return str(path)
@@ -0,0 +1,112 @@
+"""The keymap parser of the first kbd-layout.py.
+
+kbd-bench.py times the parser against it and the tests check that both
+read the bundled keymaps alike.
+"""
+import os
+
+
+MODIFIERS = {
+    'plain': 0,
+    'shift': 1,
+    'altgr': 2,
+    'control': 4,
+    'alt': 8,
+    'shiftl': 16,
+    'shiftr': 32,
+    'ctrll': 64,
+    'ctrlr': 128,
+    'capsshift': 256,
+}
+
+
+def default_keycode_keysyms(x, X, selected_columns):
+    control = f'Control_{x.lower()}'
+    keysyms = [
+        f'+{x}', f'+{X}', f'+{x}', f'+{X}',
+        control, control, control, control,
+        f'Meta_{x}', f'Meta_{X}', f'Meta_{x}', f'Meta_{X}',
+        f'Meta_{control}', f'Meta_{control}', f'Meta_{control}', f'Meta_{control}',
+    ]
+    keysyms *= 16
+    result = ['VoidSymbol']*(selected_columns[-1] + 1)
+    for column in selected_columns:
+        if column >= len(result):
+            raise ValueError(f'Column {column} is out of range -- only {len(result)} keysyms are defined')
+        result[column] = keysyms[column]
+    return result
+
+
+def expand_one_keysym(keysym, selected_columns):
+    c = keysym
+    if c.startswith('+'):
+        c = c[1:]
+    if len(c) == 1 and 'A' <= c <= 'Z':
+        return default_keycode_keysyms(c, c.lower(), selected_columns)
+    if len(c) == 1 and 'a' <= c <= 'z':
+        return default_keycode_keysyms(c, c.upper(), selected_columns)
+    return [keysym]*(selected_columns[-1] + 1)
+
+
+def load_keymap(filename, include_dir, *, keymap=None):
+    """Parse a keymap into {keycode: [keysym, ...]} the way kbd-layout.py did before its parser was rewritten.
+
+    This is the line loop of the first kbd-layout.py, with includes looked
+    up in include_dir, kept as the reference the parser is benchmarked and
+    tested against. Strings, compose sequences and charsets are skipped.
+    """
+    columns = list(range(256))
+    if keymap is None:
+        keymap = {}
+    with open(filename, 'r', encoding='latin1') as f:
+        line_continuation = ''
+        for line in f:
+            line = line.strip('\n')
+            if line.endswith('\\'):
+                line_continuation += line[:-1]
+                continue
+            line = line_continuation + line
+            line_continuation = ''
+
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('include'):
+                name = line[len('include'):].strip()
+                name = name[1:-1] if name[0] in '\'"' and name[-1] == name[0] else name
+                load_keymap(os.path.join(include_dir, name + '.inc'), include_dir, keymap=keymap)
+            elif line.startswith(('charset', 'alt_is_meta', 'string', 'compose')):
+                pass
+            elif line.startswith('keycode'):
+                code, definition = line[len('keycode'):].split('=')
+                code = int(code.strip())
+                definition = definition.split()
+                if not definition:
+                    keysyms = []
+                elif len(definition) == 1:
+                    keysyms = expand_one_keysym(definition[0], columns)
+                else:
+                    keysyms = ['VoidSymbol']*(columns[-1] + 1)
+                    for i, keysym in enumerate(definition):
+                        keysyms[columns[i]] = keysym
+                keymap[code] = keysyms
+            elif line.startswith(tuple(MODIFIERS)):
+                column = 0
+                while line and not line.startswith('keycode'):
+                    modifier = next(name for name in MODIFIERS if line.startswith(name))
+                    column |= MODIFIERS[modifier]
+                    line = line[len(modifier):].lstrip()
+                code, keysym = line[len('keycode'):].split('=')
+                code = int(code.strip())
+                keysyms = keymap.setdefault(code, [])
+                if column >= len(keysyms):
+                    keysyms.extend(['VoidSymbol']*(column - len(keysyms) + 1))
+                keysyms[column] = keysym.strip()
+            elif line.startswith('keymaps'):
+                columns = []
+                for column_range in line[len('keymaps'):].strip().split(','):
+                    start, dash, end = column_range.partition('-')
+                    columns.extend(range(int(start), int(end or start) + 1))
+            else:
+                raise ValueError(f'Unexpected line: {line}')
+    return keymap
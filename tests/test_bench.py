@@ -0,0 +1,82 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+BENCH = os.path.join(ROOT, 'kbd-bench.py')
+
+
+@pytest.fixture(scope='module')
+def bench():
+    spec = importlib.util.spec_from_file_location('kbd_bench', BENCH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def results(**seconds):
+    return {name.replace('__', '/'): {'seconds': value} for name, value in seconds.items()}
+
+
+def test_compare_scales_by_the_reference(bench):
+    baseline = {bench.REFERENCE: {'seconds': 0.010}, 'a': {'seconds': 0.010}, 'b': {'seconds': 0.010}}
+    current = {bench.REFERENCE: {'seconds': 0.020}, 'a': {'seconds': 0.025}, 'b': {'seconds': 0.035}, 'new': {'seconds': 1.0}}
+    # The machine is twice as slow: a is 1.25x its baseline and b 1.75x.
+    assert bench.compare(current, baseline, 1.5, 0.0005) == ['b']
+    assert (current['a']['baseline_ratio'], current['b']['baseline_ratio']) == (1.25, 1.75)
+
+
+def test_compare_noise_floor(bench):
+    baseline = {'a': {'seconds': 0.0001}}
+    current = {'a': {'seconds': 0.0004}}
+    assert bench.compare(current, baseline, 1.5, 0.0005) == []
+    assert bench.compare(current, baseline, 1.5, 0.0001) == ['a']
+
+
+def test_behind_reference(bench):
+    current = {'a': {'reference_ratio': 0.9}, 'b': {'reference_ratio': 1.0}, 'c': {'seconds': 1.0}}
+    assert bench.behind_reference(current) == ['b']
+
+
+def test_reference_ratio(bench, monkeypatch):
+    clock = iter([0, 1, 3, 10, 12, 13, 20, 21, 25])
+    monkeypatch.setattr(bench.time, 'perf_counter', lambda: next(clock))
+    calls = []
+    # Every turn times func, then the reference; a turn slowed down by a
+    # burst of load does not move the median.
+    ratio = bench.reference_ratio(lambda: calls.append('f'), lambda: calls.append('r'), number=2, pairs=3)
+    assert ratio == 0.5 and calls == ['f', 'f', 'r', 'r'] * 3
+
+
+def test_over_budget(bench):
+    current = results(startup__help=0.08, startup__run=0.05, parse=1.0)
+    assert bench.over_budget(current, 0.07) == ['startup/help']
+
+
+def test_synthetic_keymaps_parse(bench, tmp_path):
+    big = str(tmp_path / 'big.map')
+    bench.write_big_keymap(big, keycodes=10, columns=256)
+    dumpkeys = str(tmp_path / 'dumpkeys.map')
+    bench.write_dumpkeys_keymap(dumpkeys, keycodes=10, columns=16)
+    deep = bench.write_include_chain(str(tmp_path), depth=4, keycodes=3)
+    kbd = bench.load_kbd_layout()
+    assert [len(kbd.load_keymap(big, include_path=[]).keysyms(code)) for code in range(1, 11)] == [256]*10
+    assert len(kbd.load_keymap(dumpkeys, include_path=[])) == 10
+    assert len(kbd.load_keymap(deep, include_path=[]).files) == 5
+
+
+def test_failing_results_are_not_saved(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    run = subprocess.run(
+        [sys.executable, BENCH, '--filter', 'startup/help', '--repeat', '1', '--min-time', '0', '--startup-budget', '0', '--save', str(baseline)],
+        capture_output=True, text=True,
+    )
+    assert run.returncode == 1
+    assert 'over budget: startup/help' in run.stderr and 'not saving' in run.stderr
+    assert not baseline.exists()
+    assert list(json.loads(run.stdout)['results']) == ['startup/help']
@@ -0,0 +1,588 @@
+import importlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+import kbd_layout
+import reference_parser
+from conftest import BUNDLED_KEYMAPS, KEYMAP_DIR, ROOT, write_keymap
+
+
+@pytest.mark.parametrize('filename', BUNDLED_KEYMAPS, ids=os.path.basename)
+def test_parse_matches_reference_parser(filename):
+    reference = reference_parser.load_keymap(filename, KEYMAP_DIR)
+    keymap = kbd_layout.load_keymap(filename, include_path=[KEYMAP_DIR])
+    assert sorted(keymap) == sorted(reference)
+    for code, keysyms in reference.items():
+        assert keymap.keysyms(code) == keysyms, code
+
+
+def test_includes_are_parsed_once(tmp_path, monkeypatch):
+    parsed = []
+    open_keymap = kbd_layout.open_keymap
+    monkeypatch.setattr(kbd_layout, 'open_keymap', lambda path: parsed.append(os.path.basename(path)) or open_keymap(path))
+    common = write_keymap(tmp_path, 'keycode 30 = a\n', 'common.inc')
+    first = write_keymap(tmp_path, 'include "common"\nkeycode 31 = s\n', 'first.map')
+    second = write_keymap(tmp_path, 'include "common"\nkeycode 31 = d\n', 'second.map')
+    keymaps = [kbd_layout.load_keymap(filename, include_path=[]) for filename in [first, second, first]]
+    assert parsed == ['first.map', 'common.inc', 'second.map']
+    assert [(keymap.keysym(30, 0), keymap.keysym(31, 0)) for keymap in keymaps] == [('+a', '+s'), ('+a', '+d'), ('+a', '+s')]
+
+    write_keymap(tmp_path, 'keycode 30 = b b\n', 'common.inc')
+    assert kbd_layout.load_keymap(second, include_path=[]).keysym(30, 1) == 'b'
+    assert parsed[3:] == ['common.inc']
+    assert kbd_layout.load_keymap(first, include_path=[]).keysyms(30)[:2] == ['b', 'b']
+    assert os.path.realpath(common) in kbd_layout.load_keymap(first, include_path=[]).files
+
+
+def test_include_path(tmp_path):
+    for directory, keysym in [('first', 'a'), ('second', 'b')]:
+        (tmp_path / directory).mkdir()
+        write_keymap(tmp_path / directory, f'keycode 30 = {keysym}\n', 'common.inc')
+    filename = write_keymap(tmp_path, 'include "common"\n')
+    for include_path, keysym in [(['first', 'second'], '+a'), (['second', 'first'], '+b')]:
+        keymap = kbd_layout.load_keymap(filename, include_path=[str(tmp_path / directory) for directory in include_path])
+        assert keymap.keysym(30, 0) == keysym
+
+
+def test_include_cycle(tmp_path):
+    write_keymap(tmp_path, 'include "second"\n', 'first.inc')
+    write_keymap(tmp_path, 'include "first"\n', 'second.inc')
+    filename = write_keymap(tmp_path, 'include "first"\n')
+    with pytest.raises(kbd_layout.IncludeError, match='Include cycle: .*first.inc -> .*second.inc -> .*first.inc'):
+        kbd_layout.load_keymap(filename, include_path=[])
+
+
+@pytest.mark.parametrize('module, suffix', [('gzip', '.gz'), ('bz2', '.bz2'), ('lzma', '.xz')])
+def test_compressed_include(tmp_path, module, suffix):
+    with importlib.import_module(module).open(tmp_path / f'common.inc{suffix}', 'wt', encoding='latin1') as f:
+        f.write('keycode 30 = a\n')
+    filename = write_keymap(tmp_path, 'include "common"\nkeycode 31 = s\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    assert (keymap.keysym(30, 0), keymap.keysym(31, 0)) == ('+a', '+s')
+
+
+def test_include_bare_name_first(tmp_path):
+    write_keymap(tmp_path, 'keycode 30 = a\n', 'common.inc')
+    write_keymap(tmp_path, 'keycode 30 = b\n', 'common')
+    filename = write_keymap(tmp_path, 'include "common"\n')
+    assert kbd_layout.load_keymap(filename, include_path=[]).keysym(30, 0) == '+b'
+    assert kbd_layout.find_include('common.inc', str(tmp_path), []) == str(tmp_path / 'common.inc')
+
+
+@pytest.mark.parametrize('text, message, line, column', [
+    ('keycode 30 = a\nfoo bar\n', 'Unexpected foo', 2, 1),
+    ('keycode x = a\n', 'Expected a keycode, found x', 1, 9),
+    ('keymaps 0-1\n  keycode 30 = a b c\n', 'Too many keysyms for keycode 30: 3 keysyms, but only 2 keymaps are declared', 2, 20),
+    ('string F1 = "abc\n', 'Unterminated string', 1, 13),
+    ('keycode 30 = \\\n  a b \\\n = \n', 'Expected a keysym, found =', 3, 2),
+])
+def test_error_location(tmp_path, text, message, line, column):
+    filename = write_keymap(tmp_path, text)
+    with pytest.raises(kbd_layout.KeymapError) as excinfo:
+        kbd_layout.load_keymap(filename, include_path=[str(tmp_path)])
+    error = excinfo.value
+    assert (error.message, error.filename, error.line, error.column) == (message, os.path.realpath(filename), line, column)
+    assert str(error) == f'{os.path.realpath(filename)}:{line}:{column}: {message}'
+
+
+def test_errors_are_collected(tmp_path):
+    filename = write_keymap(tmp_path, 'keycode 30 = a\nfoo\ninclude "missing"\nkeycode 31 = b\n')
+    errors = []
+    keymap = kbd_layout.load_keymap(filename, include_path=[str(tmp_path)], errors=errors)
+    assert [(type(error), error.line, error.column) for error in errors] == [
+        (kbd_layout.KeymapError, 2, 1),
+        (kbd_layout.IncludeError, 3, 9),
+    ]
+    assert keymap.keysym(30, 0) == '+a' and keymap.keysym(31, 0) == '+b'
+
+
+def test_compose_results_are_characters(tmp_path):
+    filename = write_keymap(tmp_path, (
+        'keymaps 0-1\n'
+        'keycode 40 = dead_acute\n'
+        'keycode 18 = e\n'
+        'keycode 57 = space\n'
+        'keycode 24 = o\n'
+        'keycode 45 = x\n'
+        "compose '\\'' 'e' to eacute\n"
+        "compose '\\'' space to U+00B4\n"
+        "compose '\\'' 'o' to U+006FU+0301\n"
+        "compose '\\'' 'x' to Escape\n"
+    ))
+    index = kbd_layout.load_keymap(filename, include_path=[]).typing_index()
+    assert index.routes('é') == (((40, 0), (18, 0)),)
+    assert index.routes('\u00b4') == (((40, 0), (57, 0)),)
+    assert sorted(character for character in index if len(character) != 1) == []
+    assert 'ESC' not in index and '\x1b' not in index
+
+
+def test_strings_and_compose_as_usual(tmp_path):
+    filename = write_keymap(tmp_path, (
+        'keycode 40 = dead_acute\n'
+        'keycode 59 = F1\n'
+        'strings as usual\n'
+        'string F2 = "two"\n'
+        'compose as usual for "iso-8859-1"\n'
+        "compose '\\'' 'e' to 'x'\n"
+    ))
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    assert (keymap.strings['F1'], keymap.strings['F2'], keymap.strings['Next']) == ('\033[[A', 'two', '\033[6~')
+    assert (keymap.compose.lookup("'", 'E'), keymap.compose.lookup("'", 'e'), len(keymap.compose)) == ('É', 'x', 68)
+    assert kbd_layout.keysym_tooltip(keymap, 'F1') == 'F1: ^[[[A'
+    assert kbd_layout.keysym_tooltip(keymap, 'dead_acute').startswith("dead_acute: A→Á a→á ")
+
+
+def test_compose_as_usual_for_other_charsets(tmp_path):
+    filename = write_keymap(tmp_path, 'compose as usual for "iso-8859-2"\n')
+    with pytest.raises(kbd_layout.KeymapError, match="Don't know how to compose for iso-8859-2"):
+        kbd_layout.load_keymap(filename, include_path=[])
+
+
+COUNT_CHUNKS = ['héllo wörld \U0001f600', 'lo\n']
+COUNT_CHARACTERS = ['l', 'ö', '\U0001f600', 'lo', '', 'z']
+
+
+def test_count_characters(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    assert kbd_layout.count_characters(COUNT_CHUNKS, COUNT_CHARACTERS) == [4, 1, 1, 0, 0, 0, 10]
+
+
+def test_count_characters_numpy_matches_counter(monkeypatch):
+    pytest.importorskip('numpy')
+    counts = kbd_layout.count_characters(COUNT_CHUNKS, COUNT_CHARACTERS)
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    assert kbd_layout.count_characters(COUNT_CHUNKS, COUNT_CHARACTERS) == counts
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='file modes are POSIX')
+def test_atomic_write_keeps_file_mode(tmp_path):
+    filename = str(tmp_path / 'out.svg')
+    umask = os.umask(0o027)
+    try:
+        kbd_layout._write_file_atomically(filename, lambda f: f.write('a'))
+        assert os.stat(filename).st_mode & 0o777 == 0o640
+        os.chmod(filename, 0o604)
+        kbd_layout._write_file_atomically(filename, lambda f: f.write('b'))
+    finally:
+        os.umask(umask)
+    assert os.stat(filename).st_mode & 0o777 == 0o604
+    assert (tmp_path / 'out.svg').read_text() == 'b'
+
+
+def render_svg(keymap, **options):
+    out = io.StringIO()
+    kbd_layout.write_svg(out, kbd_layout.LAYOUTS['iso'], keymap, scale=60, **options)
+    return out.getvalue()
+
+
+def label_table(svg):
+    return json.JSONDecoder().raw_decode(svg, svg.index('{"labels":'))[0]
+
+
+def test_compact_svg_keeps_columns(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1,4\nkeycode 30 = a A Control_a\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    svg = render_svg(keymap)
+    compact = render_svg(keymap, compact=True)
+    assert len(compact) < len(svg)
+    assert label_table(compact) == label_table(svg)
+    uses = re.findall(r'<use [^>]*>', compact)
+    assert uses and all(re.search(r' href="(#r\d+)" xlink:href="\1"', use) for use in uses)
+    assert 'xmlns:xlink="http://www.w3.org/1999/xlink"' in compact
+
+
+@pytest.mark.parametrize('options', [{}, {'compact': True}, {'label_table': True}])
+def test_svg_without_script(options):
+    keymap = kbd_layout.load_keymap(os.path.join(KEYMAP_DIR, 'uk.map'), include_path=[KEYMAP_DIR])
+    svg = render_svg(keymap, script=False, **options)
+    assert '<script' not in svg and 'data-' not in svg
+    assert svg.count('class="lbl"') == len(kbd_layout.compile_layout(kbd_layout.LAYOUTS['iso'], 60).keys)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_render_batch(tmp_path, jobs):
+    keymaps = [os.path.join(KEYMAP_DIR, name) for name in ['uk.map', 'fr.map']]
+    kbd_layout.render_batch(keymaps, ['ansi', 'iso'], [60], str(tmp_path), include_path=[KEYMAP_DIR], jobs=jobs)
+    names = [f'{name}-{layout}.svg' for name in ['uk.map', 'fr.map'] for layout in ['ansi', 'iso']]
+    assert sorted(os.listdir(tmp_path)) == sorted(names + ['index.html'])
+    assert re.findall(r'href="([^"]*)"', (tmp_path / 'index.html').read_text()) == names
+    keymap = kbd_layout.load_keymap(keymaps[1], include_path=[KEYMAP_DIR])
+    assert (tmp_path / 'fr.map-iso.svg').read_text(encoding='utf-8') == render_svg(keymap)
+
+
+def test_render_batch_scales(tmp_path):
+    kbd_layout.render_batch([os.path.join(KEYMAP_DIR, 'uk.map')], ['ansi'], [40, 60], str(tmp_path), include_path=[KEYMAP_DIR], jobs=1)
+    assert sorted(os.listdir(tmp_path)) == ['index.html', 'uk.map-ansi-40.svg', 'uk.map-ansi-60.svg']
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+
+
+def test_svg_is_streamed():
+    keymap = kbd_layout.load_keymap(os.path.join(KEYMAP_DIR, 'uk.map'), include_path=[KEYMAP_DIR])
+    out = RecordingWriter()
+    kbd_layout.write_svg(out, kbd_layout.LAYOUTS['iso'], keymap, scale=60)
+    keys = kbd_layout.compile_layout(kbd_layout.LAYOUTS['iso'], 60).keys
+    # Every key is written on its own, after the header.
+    assert len(out.writes) >= len(keys) + 2
+    assert out.writes[0].startswith('<?xml') and '<g class=' not in out.writes[0]
+    assert ''.join(out.writes) == render_svg(keymap)
+
+
+@pytest.mark.parametrize('name', ['ansi', 'iso'])
+def test_layout_render_returns_its_size(name):
+    layout = kbd_layout.LAYOUTS[name]
+    out = RecordingWriter()
+    size = layout.render(kbd_layout.RenderContext(0, 0, scale=60, keymap=kbd_layout.Keymap(), out=out))
+    compiled = kbd_layout.compile_layout(layout, 60)
+    assert size == (compiled.width, compiled.height)
+    assert sum(text.count('class="lbl"') for text in out.writes) == len(compiled.keys)
+
+
+def test_compiled_layout_is_cached_per_scale():
+    layout = kbd_layout.LAYOUTS['iso']
+    compiled = kbd_layout.compile_layout(layout, 60)
+    assert kbd_layout.compile_layout(layout, 60) is compiled
+    half = kbd_layout.compile_layout(layout, 30)
+    assert half is not compiled and (half.width, half.height) == (compiled.width / 2, compiled.height / 2)
+    assert isinstance(compiled.keys, tuple) and len({key.keycode for key in compiled.keys}) == len(compiled.keys)
+    enter = next(key for key in compiled.keys if key.keycode == 28)
+    assert enter.shape == 'polygon' and enter.points[0] == enter.points[-1]
+    escape = compiled.keys[0]
+    assert (escape.keycode, escape.shape, escape.x, escape.y, escape.width, escape.height) == (1, 'rect', 0, 0, 60, 60)
+
+
+def test_compiled_layout_renders_like_the_tree():
+    keymap = kbd_layout.load_keymap(os.path.join(KEYMAP_DIR, 'uk.map'), include_path=[KEYMAP_DIR])
+    tree = RecordingWriter()
+    kbd_layout.LAYOUTS['ansi'].render(kbd_layout.RenderContext(0, 0, scale=60, keymap=keymap, out=tree))
+    compiled = RecordingWriter()
+    kbd_layout.compile_layout(kbd_layout.LAYOUTS['ansi'], 60).render(kbd_layout.RenderContext(0, 0, scale=60, keymap=keymap, out=compiled))
+    assert ''.join(compiled.writes) == ''.join(tree.writes)
+
+
+def test_label_table():
+    table = kbd_layout.LabelTable()
+    table.add(['a', 'A', 'a', 'A', 'x'])
+    table.add(['b', 'B', 'b', 'B', ''])
+    table.add([])
+    data = table.data()
+    assert data['labels'] == ['', 'a', 'A', 'x', 'b', 'B']
+    assert data['base'] == [1, 4, 0]
+    # Columns with the same labels share their diff.
+    assert data['diffs'] == [(), (0, 2, 1, 5), (0, 3, 1, 0)]
+    assert data['columns'] == {0: 0, 1: 1, 2: 0, 3: 1, 4: 2}
+
+
+def test_label_table_declared_columns():
+    table = kbd_layout.LabelTable([0, 4])
+    table.add(['a', 'A', 'a', 'A', 'x'])
+    assert table.data()['columns'] == {0: 0, 4: 1}
+
+
+def test_label_table_in_svg(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1,4\nkeycode 30 = a A Control_a\nkeycode 31 = s S Control_s\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    assert list(label_table(render_svg(keymap, label_table=True))['columns']) == ['0', '1', '4']
+    data = label_table(render_svg(keymap))
+    assert len(data['labels']) == len(set(data['labels']))
+    assert {'a', 'A', 's', 'S', 'C-a', 'C-s'} <= set(data['labels'])
+
+
+def test_script_switches_columns_from_the_label_table():
+    keymap = kbd_layout.load_keymap(os.path.join(KEYMAP_DIR, 'uk.map'), include_path=[KEYMAP_DIR])
+    svg = render_svg(keymap)
+    assert 'data-labels' not in svg and 'data-l=' not in svg
+    assert 'data-labels' not in kbd_layout.SCRIPT and 'labelTable.diffs' in kbd_layout.SCRIPT
+    # The table comes after the keys, which the script numbers in document order.
+    assert svg.index('{"labels":') > svg.rindex('class="lbl"')
+    data = label_table(svg)
+    assert len(data['base']) == svg.count('class="lbl"')
+
+
+def test_stats_nested_phases(monkeypatch):
+    clock = iter([0.0, 1.0, 3.0, 6.0])
+    monkeypatch.setattr(kbd_layout.time, 'perf_counter', lambda: next(clock))
+    stats = kbd_layout.Stats()
+    with stats.phase('outer'):
+        with stats.phase('inner'):
+            pass
+    # The inner phase is not counted twice.
+    assert stats.phases == {'inner': 2.0, 'outer': 4.0}
+
+
+def test_stats_report_and_merge(tmp_path):
+    filename = write_keymap(tmp_path, 'include "common"\nkeycode 30 = a A\nkeycode 31 = s NotAKeysym\n')
+    write_keymap(tmp_path, 'keycode 32 = d\n', 'common.inc')
+    stats = kbd_layout.Stats()
+    keymap = kbd_layout.load_keymap(filename, include_path=[], stats=stats)
+    kbd_layout.write_svg(io.StringIO(), kbd_layout.LAYOUTS['ansi'], keymap, scale=60, stats=stats)
+    report = stats.report()
+    assert {'keymap', 'includes', 'layout', 'labels', 'render', 'serialization'} <= set(report['phases'])
+    counts = report['counts']
+    assert (counts['keymaps'], counts['included_files'], counts['keycodes']) == (1, 1, 3)
+    assert counts['unknown_keysyms'] == 1 and counts['output_bytes'] > 0
+    total = kbd_layout.Stats()
+    total.merge(report)
+    total.merge(report)
+    assert total.counts['keycodes'] == 6
+    assert total.phases['render'] == pytest.approx(2 * report['phases']['render'])
+
+
+def test_stats_on_stderr(tmp_path):
+    out = tmp_path / 'out.svg'
+    run = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'kbd_layout.py'), '--stats', '-I', KEYMAP_DIR, '-o', str(out), os.path.join(KEYMAP_DIR, 'uk.map')],
+        capture_output=True, text=True, check=True,
+    )
+    report = json.loads(run.stderr)
+    assert 'startup' in report['phases'] and report['counts']['output_bytes'] == len(out.read_bytes())
+
+
+def test_resolve_keysym():
+    assert kbd_layout.resolve_keysym('+a') == ('+a', 'ok', None)
+    assert kbd_layout.resolve_keysym('U+20ac') == ('€', 'ok', None)
+    assert kbd_layout.resolve_keysym('Meta_a') == ('M-a', 'ok', None)
+    assert kbd_layout.resolve_keysym('Frobnicate') == ('Frobnicate', 'unknown', None)
+    assert kbd_layout.resolve_keysym('Meta_Frobnicate') == ('Meta_Frobnicate', 'error', 'Unknown keysym: Meta_Frobnicate')
+    assert kbd_layout.resolve_keysym('U+xyz').status == 'error'
+    with pytest.raises(ValueError, match='Unknown keysym: Meta_Frobnicate'):
+        kbd_layout.keysym_label('Meta_Frobnicate')
+
+
+def test_resolve_labels(tmp_path, monkeypatch):
+    filename = write_keymap(tmp_path, 'keymaps 0-2\nkeycode 30 = a A Meta_Frobnicate\nkeycode 31 = a Frobnicate\nkeycode 32 = s\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    resolved = []
+    resolve_keysym = kbd_layout.resolve_keysym
+    monkeypatch.setattr(kbd_layout, 'resolve_keysym', lambda keysym: resolved.append(keysym) or resolve_keysym(keysym))
+    matrix = kbd_layout.resolve_labels(keymap, [30, 31])
+    assert matrix.labels == {30: ['a', 'A', 'Meta_Frobnicate'], 31: ['a', 'Frobnicate', '']}
+    assert matrix.unknown == {'Frobnicate'}
+    assert matrix.errors == {'Meta_Frobnicate': 'Unknown keysym: Meta_Frobnicate'}
+    # Every distinct keysym is resolved once.
+    assert sorted(resolved) == sorted({keysym for code in [30, 31] for keysym in keymap.keysyms(code)})
+    assert set(kbd_layout.resolve_labels(keymap).labels) == {30, 31, 32}
+
+
+def test_check_keymap(tmp_path):
+    filename = write_keymap(tmp_path, 'include "missing"\nkeycode 30 = a Frobnicate\nkeycode 31 = s Frobnicate\nkeycode 200 = d\nkeycode 201 = VoidSymbol\nkeycode = x\n')
+    problems = {problem['kind']: problem for problem in kbd_layout.check_keymap(filename, include_path=[])}
+    assert list(problems) == ['include', 'syntax', 'unknown-keysym', 'unplaced-keycodes', 'empty-keys']
+    assert (problems['include']['line'], problems['syntax']['line']) == (1, 6)
+    assert problems['include']['file'] == problems['syntax']['file'] == filename
+    assert (problems['unknown-keysym']['keysym'], problems['unknown-keysym']['keycodes']) == ('Frobnicate', [30, 31])
+    assert problems['unplaced-keycodes']['keycodes'] == [200]
+    layout_codes = {key.keycode for key in kbd_layout.compile_layout(kbd_layout.LAYOUTS['ansi'], 60).keys}
+    assert problems['empty-keys']['keycodes'] == sorted(layout_codes - {30, 31})
+
+
+def test_check_keymap_unreadable(tmp_path):
+    assert kbd_layout.check_keymap(str(tmp_path / 'missing.map'), include_path=[])[0]['kind'] == 'error'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_check_tree(tmp_path, jobs):
+    (tmp_path / 'include').mkdir()
+    (tmp_path / 'us').mkdir()
+    write_keymap(tmp_path / 'include', 'keycode 30 = a\n', 'common.inc')
+    write_keymap(tmp_path / 'us', 'include "common"\n', 'good.map')
+    write_keymap(tmp_path / 'us', 'keycode 30 = Frobnicate\n', 'bad.map')
+    write_keymap(tmp_path / 'us', 'not a keymap\n', 'notes.txt')
+    report = kbd_layout.check_tree(str(tmp_path), jobs=jobs)
+    assert report['include_path'] == [str(tmp_path / 'include')]
+    assert [os.path.basename(result['keymap']) for result in report['results']] == ['bad.map', 'good.map']
+    assert report['keymaps'] == 2 and report['problems'] == {'unknown-keysym': 1, 'empty-keys': 2}
+    assert json.loads(json.dumps(report)) == report
+
+
+def test_layers(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-2\nkeycode 30 = +a +A +aacute\nkeycode 31 = s S s\nkeycode 42 = Shift\nkeycode 100 = AltGr\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    svg = render_svg(keymap, layers=True)
+    assert kbd_layout.LAYERS_SCRIPT in svg and 'labelTable' not in svg
+    assert '<svg class="col-0"' in svg
+    layers = [re.findall(r'>([^<>]+)</text>', layer) for layer in re.findall(r'<g class="layer L\d+">(.*?)</g>', svg)]
+    # Caps lock shows the shifted column, which is not declared in column 2.
+    assert layers == [
+        ['a', 's', 'SHIFT', 'ALTGR'], ['A', 's', 'SHIFT', 'ALTGR'], ['A', 'S', 'SHIFT', 'ALTGR'],
+        ['a', 'S', 'SHIFT', 'ALTGR'], ['á', 's', 'SHIFT', 'ALTGR'], ['s', 'SHIFT', 'ALTGR'],
+    ]
+    assert '.col-0:not(.caps) .L0,.col-0.caps .L1,.col-1:not(.caps) .L2,.col-1.caps .L3,.col-2:not(.caps) .L4,.col-2.caps .L5{display:inline}' in svg
+    assert '<g class="key mod mod-1" data-mod="1">' in svg and '<g class="key mod mod-2" data-mod="2">' in svg
+    assert '.on-1 .mod-1 .bg,.on-2 .mod-2 .bg{fill:#fd9}' in svg
+
+
+def test_layers_are_shared(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = s s\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    svg = render_svg(keymap, layers=True)
+    assert svg.count('<g class="layer ') == 1 and '.col-0 .L0,.col-1 .L0{display:inline}' in svg
+
+
+def test_layers_without_script(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    svg = render_svg(keymap, layers=True, script=False)
+    assert '<script' not in svg and '<g class="layer L0">' in svg
+
+
+def test_layers_cannot_use_the_label_table():
+    run = subprocess.run([sys.executable, os.path.join(ROOT, 'kbd_layout.py'), '--layers', '--label-table', 'uk.map'], capture_output=True, text=True)
+    assert run.returncode == 2 and '--layers and --label-table cannot be combined' in run.stderr
+
+
+def test_layout_data(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1,4\nkeycode 30 = a A Control_a\nkeycode 28 = Return\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    data = kbd_layout.layout_data('iso', keymap, scale=60, keymap_name='test.map')
+    compiled = kbd_layout.compile_layout(kbd_layout.LAYOUTS['iso'], 60)
+    assert (data['keymap'], data['layout'], data['scale'], data['columns']) == ('test.map', 'iso', 60, [0, 1, 4])
+    assert (data['width'], data['height']) == (compiled.width, compiled.height)
+    assert [key['keycode'] for key in data['keys']] == [key.keycode for key in compiled.keys]
+    keys = {key['keycode']: key for key in data['keys']}
+    assert keys[30]['keysyms'] == ['a', 'A', 'Control_a'] and keys[30]['labels'] == ['a', 'A', 'C-a']
+    assert keys[1]['keysyms'] == ['VoidSymbol'] * 3 and keys[1]['labels'] == [''] * 3
+    assert keys[28]['shape'] == 'polygon' and keys[28]['points'][0] == keys[28]['points'][-1]
+    assert 'points' not in keys[30]
+
+
+def test_write_json(tmp_path):
+    keymap = kbd_layout.load_keymap(os.path.join(KEYMAP_DIR, 'fr.map'), include_path=[KEYMAP_DIR])
+    out = io.StringIO()
+    kbd_layout.write_json(out, 'ansi', keymap, scale=40)
+    text = out.getvalue()
+    assert text.count('\n') == 1 and text.endswith('\n') and '\\u' not in text
+    assert json.loads(text) == json.loads(json.dumps(kbd_layout.layout_data('ansi', keymap, scale=40)))
+
+
+def test_write_ndjson(tmp_path):
+    keymaps = [os.path.join(KEYMAP_DIR, 'uk.map'), str(tmp_path / 'missing.map'), os.path.join(KEYMAP_DIR, 'fr.map')]
+    out = io.StringIO()
+    kbd_layout.write_ndjson(out, keymaps, ['ansi', 'iso'], [40, 60], include_path=[KEYMAP_DIR])
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(line['keymap'], line.get('layout'), line.get('scale')) for line in lines] == [
+        (keymaps[0], 'ansi', 40), (keymaps[0], 'ansi', 60), (keymaps[0], 'iso', 40), (keymaps[0], 'iso', 60),
+        (keymaps[1], None, None),
+        (keymaps[2], 'ansi', 40), (keymaps[2], 'ansi', 60), (keymaps[2], 'iso', 40), (keymaps[2], 'iso', 60),
+    ]
+    assert 'missing.map' in lines[4]['error']
+
+
+def test_keymap_diff(tmp_path):
+    old = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\nkeycode 31 = s S\nkeycode 32 = d\n', 'old.map'), include_path=[])
+    new = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-2\nkeycode 30 = a B\nkeycode 31 = s S sacute\nkeycode 33 = f F\n', 'new.map'), include_path=[])
+    diff = kbd_layout.keymap_diff(old, new)
+    assert diff == {
+        30: [(1, 'changed', 'A', 'B')],
+        31: [(2, 'added', 'VoidSymbol', 'sacute')],
+        # A single letter is bound with its capital.
+        32: [(0, 'removed', '+d', 'VoidSymbol'), (1, 'removed', '+D', 'VoidSymbol')],
+        33: [(0, 'added', 'VoidSymbol', 'f'), (1, 'added', 'VoidSymbol', 'F')],
+    }
+    assert kbd_layout.keymap_diff(old, old) == {}
+    summary = kbd_layout.diff_summary('old.map', 'new.map', diff)
+    assert summary.splitlines() == [
+        'old.map -> new.map: 4 keycodes, 6 bindings differ (3 added, 2 removed, 1 changed)',
+        '  keycode 30 shift: A -> B',
+        '  keycode 31 altgr: added sacute',
+        '  keycode 32 plain: removed +d',
+        '  keycode 32 shift: removed +D',
+        '  keycode 33 plain: added f',
+        '  keycode 33 shift: added F',
+    ]
+
+
+def test_write_diff_svg(tmp_path):
+    old = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\nkeycode 31 = s S\n', 'old.map'), include_path=[])
+    new = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a B\nkeycode 31 = s S\n', 'new.map'), include_path=[])
+    out = io.StringIO()
+    kbd_layout.write_diff_svg(out, kbd_layout.LAYOUTS['iso'], old, new, scale=60)
+    svg = out.getvalue()
+    assert '<g class="key changed-1"><title>keycode 30 shift: A -&gt; B</title>' in svg
+    assert '.col-1 .changed-1 .bg{fill:#fe9}' in svg
+    assert svg.count('changed-1') == 2
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_diff_batch(tmp_path, jobs):
+    uk, fr = (os.path.join(KEYMAP_DIR, name) for name in ['uk.map', 'fr.map'])
+    output_dir = tmp_path / 'out'
+    summaries = kbd_layout.diff_batch([(uk, fr), (fr, fr)], 'iso', 60, str(output_dir), include_path=[KEYMAP_DIR], jobs=jobs)
+    keymaps = [kbd_layout.load_keymap(filename, include_path=[KEYMAP_DIR]) for filename in [uk, fr]]
+    assert summaries == [kbd_layout.diff_summary(uk, fr, kbd_layout.keymap_diff(*keymaps)), kbd_layout.diff_summary(fr, fr, {})]
+    assert sorted(os.listdir(output_dir)) == ['fr.map--fr.map-iso.svg', 'index.html', 'uk.map--fr.map-iso.svg']
+    assert re.findall(r'href="([^"]*)"', (output_dir / 'index.html').read_text()) == ['uk.map--fr.map-iso.svg', 'fr.map--fr.map-iso.svg']
+
+
+def test_keymap_changes(tmp_path):
+    old = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\nkeycode 31 = s S\n', 'old.map'), include_path=[])
+    new = kbd_layout.load_keymap(write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a B\nkeycode 31 = s S\nkeycode 32 = d D\n', 'new.map'), include_path=[])
+    assert kbd_layout.keymap_changes(old, new) == {30: [1], 32: [0, 1]}
+
+
+def test_incremental_svg(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\nkeycode 31 = s S\n')
+    svg = kbd_layout.IncrementalSvg(kbd_layout.LAYOUTS['iso'], kbd_layout.load_keymap(filename, include_path=[]), scale=60)
+    compiled = svg.compiled
+    write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a B\nkeycode 31 = s S\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    patches = svg.update(keymap)
+    assert list(patches) == [k for k, key in enumerate(compiled.keys) if key.keycode == 30]
+    assert '>a<' in patches[list(patches)[0]]
+    assert svg.compiled is compiled and svg.keymap is keymap
+    assert svg.fragments == kbd_layout.IncrementalSvg(kbd_layout.LAYOUTS['iso'], keymap, scale=60).fragments
+    document = io.StringIO()
+    svg.write(document)
+    assert 'B' in label_table(document.getvalue())['labels']
+    assert svg.update(keymap) == {}
+
+
+def test_incremental_svg_declared_columns(tmp_path):
+    filename = write_keymap(tmp_path, 'keymaps 0-1\nkeycode 30 = a A\n')
+    svg = kbd_layout.IncrementalSvg(kbd_layout.LAYOUTS['iso'], kbd_layout.load_keymap(filename, include_path=[]), scale=60, label_table=True)
+    write_keymap(tmp_path, 'keymaps 0-2\nkeycode 30 = a A aacute\n')
+    keymap = kbd_layout.load_keymap(filename, include_path=[])
+    # The table of the declared columns is built again.
+    assert len(svg.update(keymap)) == len(svg.compiled.keys)
+    assert svg.table.data()['columns'] == {0: 0, 1: 1, 2: 2}
+
+
+def test_live_server():
+    from urllib.request import urlopen
+
+    server = kbd_layout.LiveServer(0)
+    server.publish('<svg/>')
+    with urlopen(server.url) as response:
+        assert response.read() == b'<svg/>'
+        assert response.headers['Content-Type'] == 'image/svg+xml; charset=utf-8'
+
+
+def test_import_is_lazy():
+    # A fresh interpreter, since the other tests build the tables.
+    code = (
+        'import sys, kbd_layout\n'
+        'assert not {"json", "re", "concurrent.futures", "http.server"} & set(sys.modules), sys.modules\n'
+        'assert kbd_layout.labels_table.cache_info().currsize == 0\n'
+        'assert not kbd_layout.LAYOUTS._layouts\n'
+        'assert kbd_layout.LABELS["Up"] == "\\u2191"\n'
+        'assert kbd_layout.ISO_LAYOUT is kbd_layout.LAYOUTS["iso"]\n'
+        'assert list(kbd_layout.LAYOUTS._layouts) == ["iso"]\n'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+
+def test_help():
+    run = subprocess.run([sys.executable, os.path.join(ROOT, 'kbd_layout.py'), '--help'], capture_output=True, text=True, check=True)
+    assert run.stdout.startswith('usage:') and '--layout' in run.stdout
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import kbd_layout
+from conftest import BUNDLED_KEYMAPS, KEYMAP_DIR, write_keymap
+
+
+@pytest.mark.parametrize('filename', BUNDLED_KEYMAPS, ids=os.path.basename)
+def test_disk_cache_matches_parse(filename, tmp_path):
+    keymap = kbd_layout.load_keymap(filename, include_path=[KEYMAP_DIR], cache_dir=str(tmp_path))
+    kbd_layout.clear_caches()
+    cached = kbd_layout.load_keymap(filename, include_path=[KEYMAP_DIR], cache_dir=str(tmp_path))
+    assert list(cached) == list(keymap)
+    assert [cached.keysyms(code) for code in cached] == [keymap.keysyms(code) for code in keymap]
+
+
+def load_cached(filename, include_path, cache_dir):
+    kbd_layout.clear_caches()
+    stats = kbd_layout.Stats()
+    keymap = kbd_layout.load_keymap(filename, include_path=include_path, cache_dir=cache_dir, stats=stats)
+    return keymap, stats.counts.get('keymap_cache_hits', 0)
+
+
+def test_disk_cache_checks_includes(tmp_path):
+    keymaps, includes, cache = tmp_path / 'keymaps', tmp_path / 'include', str(tmp_path / 'cache')
+    keymaps.mkdir()
+    includes.mkdir()
+    filename = write_keymap(keymaps, 'include "common"\nkeycode 31 = s\n')
+    write_keymap(includes, 'keycode 30 = a\n', 'common.inc')
+    assert load_cached(filename, [str(includes)], cache)[0].keysym(30, 0) == '+a'
+    assert load_cached(filename, [str(includes)], cache)[1] == 1
+
+    # A file next to the keymap now shadows the include.
+    write_keymap(keymaps, 'keycode 30 = b\n', 'common.inc')
+    keymap, hits = load_cached(filename, [str(includes)], cache)
+    assert (keymap.keysym(30, 0), hits) == ('+b', 0)
+
+    write_keymap(keymaps, 'keycode 30 = c\n', 'common.inc')
+    keymap, hits = load_cached(filename, [str(includes)], cache)
+    assert (keymap.keysym(30, 0), hits) == ('+c', 0)
+    assert load_cached(filename, [str(includes)], cache)[1] == 1
+
+
+def test_disk_cache_evicts_old_entries(tmp_path):
+    cache = tmp_path / 'cache'
+    filename = write_keymap(tmp_path, 'keycode 30 = a\n')
+    load_cached(filename, [], str(cache))
+    write_keymap(tmp_path, 'keycode 30 = b\n')
+    assert load_cached(filename, [], str(cache))[0].keysym(30, 0) == '+b'
+    assert len(list(cache.glob('*.keymap'))) == 1
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import kbd_layout
+
+
+@pytest.mark.parametrize('name', ['ansi', 'iso'])
+def test_registry_loads_layouts_on_first_use(name):
+    registry = kbd_layout.LayoutRegistry(kbd_layout.LAYOUT_DIR)
+    assert list(registry) == ['ansi', 'iso'] and name in registry
+    assert registry._layouts == {}
+    assert registry[name] is registry[name] and list(registry._layouts) == [name]
+    assert kbd_layout.compile_layout(registry[name], 60).keys
+
+
+@pytest.mark.parametrize('name', ['', 'missing', '../layouts/ansi', '.hidden'])
+def test_registry_unknown_names(name):
+    assert name not in kbd_layout.LAYOUTS
+    with pytest.raises(KeyError):
+        kbd_layout.LAYOUTS[name]
+
+
+def write_layout(tmp_path, fragments, layout):
+    path = tmp_path / 'layout.json'
+    path.write_text(json.dumps({'layout': layout, 'fragments': fragments}), encoding='utf-8')
+    return str(path)
+
+
+def layout_keycodes(layout):
+    return [key.keycode for key in kbd_layout.compile_layout(layout, 60).keys]
+
+
+def test_fragments_are_spliced(tmp_path):
+    filename = write_layout(tmp_path, {
+        'digits': [2, 3, {'fragment': 'more'}],
+        'more': [4, {'key': 14, 'width': 2}],
+    }, {'vblock': [
+        {'row': [1, {'fragment': 'digits'}, {'space': 1}]},
+        {'row': [{'fragment': 'more'}, 15, 16, {'space': 2}]},
+    ]})
+    assert layout_keycodes(kbd_layout.load_layout(filename)) == [1, 2, 3, 4, 14, 4, 14, 15, 16]
+
+
+@pytest.mark.parametrize('fragments, path, message', [
+    ({'a': [{'fragment': 'a'}]}, 'layout.row[0].a[0]', 'fragment cycle: a -> a'),
+    ({'a': [{'row': [{'fragment': 'b'}]}], 'b': [1, {'fragment': 'a'}]}, 'layout.row[0].a[0].row[0].b[1]', 'fragment cycle: a -> b -> a'),
+    ({}, 'layout.row[0]', "Unknown fragment: 'a'"),
+    ({'a': [{'key': 30, 'colour': 'red'}]}, 'layout.row[0].a[0]', 'Unknown fields of key: colour'),
+    ({'a': [{'key': 30, 'width': -1}]}, 'layout.row[0].a[0]', 'width must be a non-negative number'),
+    ({'a': [True]}, 'layout.row[0].a[0]', 'Expected a keycode or a node'),
+])
+def test_fragment_errors(tmp_path, fragments, path, message):
+    filename = write_layout(tmp_path, fragments, {'row': [{'fragment': 'a'}]})
+    with pytest.raises(kbd_layout.LayoutError) as excinfo:
+        kbd_layout.load_layout(filename)
+    assert (excinfo.value.path, excinfo.value.message) == (path, message)
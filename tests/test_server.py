@@ -0,0 +1,96 @@
+import gzip
+import http.client
+import os
+import threading
+
+import pytest
+
+import kbd_layout
+from conftest import KEYMAP_DIR, write_keymap
+
+
+@pytest.mark.parametrize('header, matches', [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('"xyz", W/"abc"', True),
+    (' "xyz" , "abc" ', True),
+    ('*', True),
+    ('"xyz"', False),
+    ('"abc', False),
+])
+def test_etag_matches(header, matches):
+    assert kbd_layout.etag_matches('"abc"', header) is matches
+
+
+@pytest.fixture(scope='module')
+def server():
+    service = kbd_layout.RenderService([KEYMAP_DIR], include_path=[KEYMAP_DIR])
+    server = kbd_layout.make_server(service, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(server, path, headers=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=30)
+    try:
+        connection.request('GET', path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('name', ['uk', 'uk.map'])
+def test_server_finds_map_files(server, name):
+    status, headers, body = get(server, f'/render?keymap={name}')
+    assert status == 200
+
+
+def test_find_keymap_only_accepts_map_files(tmp_path):
+    write_keymap(tmp_path, 'keycode 30 = a\n', 'notes.txt')
+    write_keymap(tmp_path, 'keycode 30 = a\n', 'common.inc')
+    with gzip.open(tmp_path / 'packed.map.gz', 'wt', encoding='latin1') as f:
+        f.write('keycode 30 = a\n')
+    service = kbd_layout.RenderService([str(tmp_path)], include_path=[])
+    assert service.find_keymap('packed') == service.find_keymap('packed.map.gz') == os.path.realpath(tmp_path / 'packed.map.gz')
+    for name in ['notes.txt', 'common.inc', 'common']:
+        with pytest.raises(LookupError):
+            service.find_keymap(name)
+
+
+def test_server_renders_with_etag(server):
+    status, headers, body = get(server, '/render?keymap=uk&layout=iso&scale=40')
+    assert status == 200
+    assert headers['Content-Type'] == 'image/svg+xml; charset=utf-8'
+    assert body.startswith(b'<?xml') or body.startswith(b'<svg')
+    assert int(headers['Content-Length']) == len(body)
+
+    etag = headers['ETag']
+    for if_none_match in [etag, f'"other", W/{etag}', '*']:
+        status, headers, body = get(server, '/render?keymap=uk&layout=iso&scale=40', {'If-None-Match': if_none_match})
+        assert (status, headers['ETag'], body) == (304, etag, b'')
+    status, headers, body = get(server, '/render?keymap=uk&layout=iso&scale=40', {'If-None-Match': '"other"'})
+    assert status == 200 and headers['ETag'] == etag
+
+    status, headers, body = get(server, '/render?keymap=uk&layout=iso&scale=60')
+    assert status == 200 and headers['ETag'] != etag
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/', 404),
+    ('/render?keymap=missing', 404),
+    ('/render?keymap=../kbd_layout.py', 404),
+    ('/render?keymap=qwerty-layout.inc', 404),
+    ('/render?keymap=qwerty-layout', 404),
+    ('/render', 400),
+    ('/render?keymap=uk&layout=missing', 400),
+    ('/render?keymap=uk&scale=big', 400),
+    ('/render?keymap=uk&scale=1', 400),
+])
+def test_server_errors(server, path, status):
+    assert get(server, path)[0] == status